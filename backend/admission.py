@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .symptom_rules import PRIORITY_URGENT, matcher as symptom_matcher
+from .workers import worker_share
+
+PRIORITY_NAMES = {0: "urgent", 1: "normal", 2: "low"}
+
+
+class AdmissionRejected(Exception):
+    """
+    The request was not admitted; the client should retry after `retry_after` seconds
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def classify_priority(message: str) -> int:
+    """
+    Cheap triage from the symptom rule vocabulary: one regex pass, no model call
+    """
+    return symptom_matcher.priority(message)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    Per-user token buckets: `burst` requests at once, refilled at `per_minute`.
+
+    Buckets live in a bounded LRU; a user who drops out of it simply starts
+    again with a full bucket. Limits are per worker process; get_rate_limiter
+    gives each worker its share of the configured limit.
+    """
+
+    def __init__(self, per_minute: float = 30.0, burst: int = 10, max_users: int = 100000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()  # user_id -> TokenBucket
+        self.limited = 0
+
+    def check(self, user_id: int):
+        """
+        Take one token for `user_id` or raise AdmissionRejected with the time until the next one
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(float(self.burst), now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return
+        self.limited += 1
+        raise AdmissionRejected("rate limited", math.ceil((1.0 - bucket.tokens) / self.rate))
+
+    def stats(self) -> dict:
+        return {
+            "per_minute": self.rate * 60.0,
+            "burst": self.burst,
+            "tracked_users": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+class AdmissionController:
+    """
+    Bounded concurrency toward the model backend with a priority queue in front.
+
+    At most `max_concurrent` requests hold a slot; the rest wait in priority
+    order (urgent, normal, low; FIFO within a priority). When `max_queue`
+    requests are already waiting a new request is rejected at once, except an
+    urgent one, which takes the place of the newest lowest-priority waiter.
+    Waiting longer than `queue_timeout` is also a rejection.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, queue_timeout: float = 5.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self._hold_time = 1.0  # moving average of seconds a slot is held, for Retry-After
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.rejected = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.timed_out = 0
+        self.evicted = 0
+
+    def retry_after(self) -> int:
+        # Roughly how long until the current queue has drained
+        backlog = (len(self._waiters) + 1) / max(self.max_concurrent, 1)
+        return max(1, min(60, math.ceil(backlog * self._hold_time)))
+
+    def _reject(self, priority: int, reason: str) -> AdmissionRejected:
+        self.rejected[PRIORITY_NAMES[priority]] += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    def _evict_for(self, priority: int) -> bool:
+        victim = max(self._waiters, key=lambda waiter: (waiter[0], waiter[1]))
+        if victim[0] <= priority:
+            return False
+        self._waiters.remove(victim)
+        heapq.heapify(self._waiters)
+        self.evicted += 1
+        victim[2].set_exception(self._reject(victim[0], "displaced by an urgent request"))
+        return True
+
+    async def acquire(self, priority: int):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted[PRIORITY_NAMES[priority]] += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            if priority != PRIORITY_URGENT or not self._evict_for(priority):
+                raise self._reject(priority, "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._leave(waiter):
+                self.timed_out += 1
+                raise self._reject(priority, "queue timeout")
+            if future.exception() is not None:
+                raise future.exception()
+        except asyncio.CancelledError:
+            if not self._leave(waiter) and future.exception() is None:
+                # The slot was handed over just as the caller went away
+                self.release()
+            raise
+        self.admitted[PRIORITY_NAMES[priority]] += 1
+
+    def _leave(self, waiter: list) -> bool:
+        """
+        Take a waiter that gave up out of the queue; False if it was already
+        given a slot or evicted
+        """
+        future = waiter[2]
+        if future.done():
+            return False
+        future.cancel()
+        self._waiters.remove(waiter)
+        heapq.heapify(self._waiters)
+        return True
+
+    def release(self, held: Optional[float] = None):
+        if held is not None:
+            self._hold_time = 0.9 * self._hold_time + 0.1 * held
+        # Hand the slot straight to the best waiter so nobody can jump the queue
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _ in self._waiters:
+            waiting[PRIORITY_NAMES[priority]] += 1
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": waiting,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "timed_out": self.timed_out,
+            "evicted": self.evicted,
+            "avg_hold_seconds": round(self._hold_time, 3),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+_limiter: Optional[RateLimiter] = None
+_urgent_limiter: Optional[RateLimiter] = None
+
+
+def get_controller() -> Optional[AdmissionController]:
+    """
+    This worker's controller, or None when ADMISSION_MAX_CONCURRENT is 0.
+    The limits are totals for the server, split across its workers
+    """
+    global _controller
+    if _controller is None:
+        max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+        if max_concurrent <= 0:
+            return None
+        _controller = AdmissionController(
+            max_concurrent=worker_share(max_concurrent),
+            max_queue=worker_share(int(os.getenv("ADMISSION_MAX_QUEUE", str(max_concurrent * 4)))),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5")),
+        )
+    return _controller
+
+
+def get_rate_limiter(priority: Optional[int] = None) -> RateLimiter:
+    """
+    The per-user limiter for a message of `priority`.
+
+    Urgent messages draw from a separate, larger bucket, so a patient who has
+    used up their normal allowance can still report an emergency, but typing
+    "urgent" into every message does not lift the limit.
+    """
+    global _limiter, _urgent_limiter
+    if _limiter is None:
+        _limiter = _limiter_from_env("RATE_LIMIT_PER_MINUTE", "30", "RATE_LIMIT_BURST", "10")
+    if priority != PRIORITY_URGENT:
+        return _limiter
+    if _urgent_limiter is None:
+        per_minute = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+        burst = int(os.getenv("RATE_LIMIT_BURST", "10"))
+        _urgent_limiter = _limiter_from_env("RATE_LIMIT_URGENT_PER_MINUTE", str(per_minute * 3),
+                                            "RATE_LIMIT_URGENT_BURST", str(burst * 3))
+    return _urgent_limiter
+
+
+def _limiter_from_env(rate_name: str, rate_default: str, burst_name: str, burst_default: str) -> RateLimiter:
+    # Requests from one user are spread over the workers, so each enforces its share
+    return RateLimiter(
+        per_minute=worker_share(float(os.getenv(rate_name, rate_default))),
+        burst=worker_share(int(os.getenv(burst_name, burst_default))),
+    )
+
+
+@asynccontextmanager
+async def model_slot(priority: int):
+    """
+    Hold a slot toward the model backend for the duration of the block
+    """
+    controller = get_controller()
+    if controller is None:
+        yield
+        return
+    async with controller.slot(priority):
+        yield
+
+
+def admission_status() -> dict:
+    controller = get_controller()
+    return {
+        "queue": controller.stats() if controller is not None else None,
+        "rate_limit": get_rate_limiter().stats(),
+        "urgent_rate_limit": get_rate_limiter(PRIORITY_URGENT).stats(),
+    }
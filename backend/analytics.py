@@ -0,0 +1,245 @@
+"""
+Symptom trends per location and day.
+
+Every user message is tagged with the symptom category the fallback rules
+would give it (fever, stomach, respiratory, chest_pain, ...). The history
+writer adds each batch's counts to `symptom_daily_counts` with one upsert, so
+`/analytics/symptoms` reads a few hundred rollup rows however many messages
+are stored.
+
+Rebuild the rollups from stored messages (e.g. after deploying this, or after
+changing the symptom rules), in chunks and while the app keeps serving; the
+old rollups stay visible until the new ones are swapped in:
+
+    python -m backend.analytics backfill [--chunk-size 5000] [--retag]
+"""
+import argparse
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import Conversation, Message, SymptomDailyCount, User
+from .symptom_rules import matcher as symptom_matcher
+
+# Tagged on the message, but not symptoms worth trending
+NON_SYMPTOM_CATEGORIES = frozenset({"greeting", "thanks", "help", "general"})
+UNKNOWN_LOCATION = "Unknown"
+
+
+def classify(message: str) -> str:
+    return symptom_matcher.classify(message)
+
+
+def rollup_key(timestamp: datetime, location: Optional[str], category: Optional[str]) -> Optional[tuple]:
+    """
+    The (day, location, category) counter a message adds to, or None if it isn't counted
+    """
+    if category is None or category in NON_SYMPTOM_CATEGORIES:
+        return None
+    return timestamp.date(), location or UNKNOWN_LOCATION, category
+
+
+def _upsert(dialect_name: str):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    statement = insert(SymptomDailyCount)
+    return statement.on_conflict_do_update(
+        index_elements=["day", "location", "category"],
+        set_={"count": SymptomDailyCount.count + statement.excluded["count"]},
+    )
+
+
+def apply_counts(db: Session, counts: Counter):
+    """
+    Add `counts` to the rollups: one multi-row upsert on SQLite and PostgreSQL.
+    The caller commits.
+    """
+    if not counts:
+        return
+    rows = [{"day": day, "location": location, "category": category, "count": count}
+            for (day, location, category), count in counts.items()]
+    statement = _upsert(db.get_bind().dialect.name)
+    if statement is not None:
+        db.execute(statement, rows)
+        return
+    # Other databases: read-modify-write, fine for the writer's single thread
+    for row in rows:
+        existing = db.get(SymptomDailyCount, (row["day"], row["location"], row["category"]))
+        if existing is None:
+            db.add(SymptomDailyCount(**row))
+        else:
+            existing.count += row["count"]
+    db.flush()
+
+
+def _trend_query(since: date, until: date, location: Optional[str]):
+    query = (
+        select(SymptomDailyCount.day, SymptomDailyCount.location, SymptomDailyCount.category, SymptomDailyCount.count)
+        .where(SymptomDailyCount.day >= since, SymptomDailyCount.day < until)
+        .order_by(SymptomDailyCount.day, SymptomDailyCount.location, SymptomDailyCount.category)
+    )
+    if location is not None:
+        query = query.where(SymptomDailyCount.location == location)
+    return query
+
+
+def _summarize(rows, since: date, until: date, days: int, location: Optional[str]) -> dict:
+    window_start = until - timedelta(days=days)
+    daily, current, previous = [], Counter(), Counter()
+    for day, row_location, category, count in rows:
+        if day >= window_start:
+            daily.append({"day": day.isoformat(), "location": row_location, "category": category, "count": count})
+            current[category] += count
+        else:
+            previous[category] += count
+    categories = [
+        {"category": category, "count": current[category], "previous_count": previous[category],
+         "change": current[category] - previous[category]}
+        for category in current | previous
+    ]
+    categories.sort(key=lambda entry: (-entry["change"], -entry["count"], entry["category"]))
+    return {
+        "since": window_start.isoformat(),
+        "until": until.isoformat(),
+        "location": location,
+        "daily": daily,
+        "categories": categories,
+    }
+
+
+def symptom_trends(db: Session, days: int, until: date, location: Optional[str] = None) -> dict:
+    """
+    Daily counts for the `days` before `until` (exclusive), and per-category
+    totals compared with the `days` before that; rising categories first
+    """
+    since = until - timedelta(days=2 * days)
+    return _summarize(db.execute(_trend_query(since, until, location)).all(), since, until, days, location)
+
+
+async def symptom_trends_async(db: AsyncSession, days: int, until: date, location: Optional[str] = None) -> dict:
+    since = until - timedelta(days=2 * days)
+    rows = (await db.execute(_trend_query(since, until, location))).all()
+    return _summarize(rows, since, until, days, location)
+
+
+def _chunk_query(after_id: int, last_id: int, chunk_size: int):
+    # The location the writer counted the message under; the user's current one for
+    # messages stored before messages.location existed
+    return (
+        select(Message.id, Message.content, Message.category, Message.timestamp,
+               func.coalesce(Message.location, User.location))
+        .join(Conversation, Message.conversation_id == Conversation.id)
+        .join(User, Conversation.user_id == User.id)
+        .where(Message.role == "user", Message.id > after_id, Message.id <= last_id)
+        .order_by(Message.id)
+        .limit(chunk_size)
+    )
+
+
+def _count(rows, retag: bool, counts: Counter) -> list:
+    """
+    Add `rows` from _chunk_query to `counts`; returns the tag updates for untagged (or `retag`) messages
+    """
+    updates = []
+    for message_id, content, category, timestamp, location in rows:
+        if category is None or retag:
+            new_category = classify(content)
+            if new_category != category:
+                updates.append({"message_id": message_id, "new_category": new_category})
+            category = new_category
+        key = rollup_key(timestamp, location, category)
+        if key is not None:
+            counts[key] += 1
+    return updates
+
+
+def backfill(session_factory, chunk_size: int = 5000, retag: bool = False, pause: float = 0.0) -> dict:
+    """
+    Rebuild the rollups from stored user messages, reading `chunk_size` messages at a time.
+
+    The live rollups are left alone while messages up to the newest id at
+    the start are recounted (in memory: one counter per day, location and
+    category). Then one transaction locks the rollups against the history
+    writer, counts the messages that arrived meanwhile and replaces the table
+    contents, so `/analytics/symptoms` sees the old totals until the new ones
+    are complete. Untagged messages (and all of them with `retag`) are
+    classified on the way.
+    """
+    db = session_factory()
+    try:
+        last_id = db.execute(select(func.max(Message.id))).scalar() or 0
+        db.commit()
+
+        counts = Counter()
+        after_id, scanned, tagged = 0, 0, 0
+        retag_statement = (update(Message).where(Message.id == bindparam("message_id"))
+                           .values(category=bindparam("new_category")))
+        while after_id < last_id:
+            rows = db.execute(_chunk_query(after_id, last_id, chunk_size)).all()
+            if not rows:
+                break
+            updates = _count(rows, retag, counts)
+            if updates:
+                db.connection().execute(retag_statement, updates)
+            db.commit()
+            after_id = rows[-1][0]
+            scanned += len(rows)
+            tagged += len(updates)
+            if pause:
+                # Leave room for the live writer between chunks
+                time.sleep(pause)
+
+        # The swap. The writer commits messages and their counts together, so
+        # once it is locked out of the rollups every message up to the new
+        # newest id is either counted below or will be added after the commit.
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("LOCK TABLE symptom_daily_counts IN EXCLUSIVE MODE"))
+        db.execute(delete(SymptomDailyCount))  # on SQLite this takes the write lock
+        newest_id = db.execute(select(func.max(Message.id))).scalar() or 0
+        while after_id < newest_id:
+            rows = db.execute(_chunk_query(after_id, newest_id, chunk_size)).all()
+            if not rows:
+                break
+            _count(rows, False, counts)
+            after_id = rows[-1][0]
+        apply_counts(db, counts)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return {"messages": scanned, "tagged": tagged, "last_id": last_id}
+
+
+def main():
+    from dotenv import load_dotenv
+    from .database import SessionLocal, init_engine
+
+    parser = argparse.ArgumentParser(description="Maintain the symptom trend rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="rebuild the rollups from stored messages")
+    backfill_parser.add_argument("--chunk-size", type=int, default=5000)
+    backfill_parser.add_argument("--retag", action="store_true", help="reclassify messages that are already tagged")
+    backfill_parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    args = parser.parse_args()
+
+    load_dotenv()
+    init_engine()
+    start = time.perf_counter()
+    result = backfill(SessionLocal, args.chunk_size, args.retag, args.pause)
+    print(f"Counted {result['messages']} messages (tagged {result['tagged']}) up to id {result['last_id']} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
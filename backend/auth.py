@@ -1,8 +1,13 @@
 from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from .models import User, UserCreate, UserResponse, LoginRequest, LoginResponse
 from datetime import datetime
-import bcrypt
+from .profile_cache import ProfileRecord, get_profile_cache
+from .metrics import timed
+from .hashing import (HashingBusyError, check_password, check_password_async, hash_password,
+                      hash_password_async, needs_rehash)
 
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
@@ -11,6 +16,11 @@ def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user or not verify_password(password, user.hashed_password):
         return None
+
+    # Upgrade hashes made with an old cost factor while we have the plain password
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = get_password_hash(password)
+        db.commit()
     return user
 
 def create_user(db: Session, user_data: UserCreate):
@@ -31,6 +41,7 @@ def create_user(db: Session, user_data: UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    get_profile_cache().invalidate(db_user.id)
     return db_user
 
 def get_user_profile(db: Session, user_id: int):
@@ -39,8 +50,133 @@ def get_user_profile(db: Session, user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def _hashing_busy():
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"}
+    )
+
+def load_profile_record(db: Session, user_id: int) -> ProfileRecord:
+    """
+    Read a user's chat context from the database and refresh the profile cache
+    """
+    row = db.query(User.id, User.full_name, User.age, User.location).filter(User.id == user_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    record = ProfileRecord(row.id, row.full_name, row.age, row.location)
+    get_profile_cache().put(record)
+    return record
+
+def _profiles_query(user_ids):
+    return select(User.id, User.full_name, User.age, User.location).where(User.id.in_(user_ids))
+
+def _cached_profiles(user_ids) -> tuple:
+    cache = get_profile_cache()
+    records, missing = {}, []
+    for user_id in user_ids:
+        record = cache.get(user_id)
+        if record is not None:
+            records[user_id] = record
+        else:
+            missing.append(user_id)
+    return records, missing
+
+def _cache_profile_rows(rows, records: dict) -> dict:
+    cache = get_profile_cache()
+    for row in rows:
+        records[row.id] = ProfileRecord(row.id, row.full_name, row.age, row.location)
+        cache.put(records[row.id])
+    return records
+
+def load_profile_records(db: Session, user_ids) -> dict:
+    """
+    Chat context for many users by id: cached ones plus a single IN query for
+    the rest. Unknown users are left out of the result.
+    """
+    records, missing = _cached_profiles(user_ids)
+    if not missing:
+        return records
+    return _cache_profile_rows(db.execute(_profiles_query(missing)), records)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    try:
+        with timed("bcrypt_verify"):
+            return check_password(plain_password, hashed_password)
+    except HashingBusyError:
+        raise _hashing_busy()
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
\ No newline at end of file
+    try:
+        with timed("bcrypt_hash"):
+            return hash_password(password)
+    except HashingBusyError:
+        raise _hashing_busy()
+
+# Async counterparts for AsyncSession, used when DB_ASYNC is on
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    try:
+        with timed("bcrypt_verify"):
+            return await check_password_async(plain_password, hashed_password)
+    except HashingBusyError:
+        raise _hashing_busy()
+
+async def get_password_hash_async(password: str) -> str:
+    try:
+        with timed("bcrypt_hash"):
+            return await hash_password_async(password)
+    except HashingBusyError:
+        raise _hashing_busy()
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username).limit(1))
+    return result.scalars().first()
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username_async(db, username)
+    if not user or not await verify_password_async(password, user.hashed_password):
+        return None
+
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(password)
+        await db.commit()
+    return user
+
+async def create_user_async(db: AsyncSession, user_data: UserCreate):
+    if await get_user_by_username_async(db, user_data.username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+
+    db_user = User(
+        username=user_data.username,
+        hashed_password=await get_password_hash_async(user_data.password),
+        full_name=user_data.full_name,
+        age=user_data.age,
+        location=user_data.location
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    get_profile_cache().invalidate(db_user.id)
+    return db_user
+
+async def get_user_profile_async(db: AsyncSession, user_id: int):
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+async def load_profile_record_async(db: AsyncSession, user_id: int) -> ProfileRecord:
+    result = await db.execute(select(User.id, User.full_name, User.age, User.location).where(User.id == user_id))
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    record = ProfileRecord(row.id, row.full_name, row.age, row.location)
+    get_profile_cache().put(record)
+    return record
+
+async def load_profile_records_async(db: AsyncSession, user_ids) -> dict:
+    records, missing = _cached_profiles(user_ids)
+    if not missing:
+        return records
+    return _cache_profile_rows(await db.execute(_profiles_query(missing)), records)
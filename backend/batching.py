@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from .inference import get_client
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests for a few milliseconds and runs them as one batch.
+
+    A batch is dispatched when `max_batch_size` items are waiting or `max_wait`
+    seconds after its first item arrived, whichever comes first. `handler`
+    receives the list of items and must return one result per item, in order;
+    each caller gets its own result (or the batch's exception) back.
+    """
+
+    def __init__(self, handler: Callable[[list], Awaitable[list]],
+                 max_batch_size: int = 8, max_wait: float = 0.01):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []  # (item, future)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batch_sizes = {}  # batch size -> number of batches sent
+        self.items_submitted = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self.items_submitted += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._dispatch)
+        if not batch:
+            return
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._cancel_when_abandoned(task, [future for _, future in batch])
+
+    @staticmethod
+    def _cancel_when_abandoned(task: asyncio.Task, futures: list):
+        """
+        Cancel the batch's request once every caller has its answer or has given up
+        """
+        remaining = [len(futures)]
+
+        def on_done(_):
+            remaining[0] -= 1
+            if remaining[0] == 0 and not task.done():
+                task.cancel()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    async def _run(self, batch: list):
+        # Callers that gave up (latency budget, disconnect) are dropped before sending
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "items": self.items_submitted,
+            "batches": batches,
+            "mean_batch_size": self.items_submitted / batches if batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+
+async def _generate_batch(prompts: List[str]) -> List[str]:
+    return await get_client().generate_batch(prompts)
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> Optional[MicroBatcher]:
+    """
+    Shared inference batcher, or None when HF_BATCH_MAX_SIZE is 1
+    """
+    global _batcher
+    max_batch_size = int(os.getenv("HF_BATCH_MAX_SIZE", "8"))
+    if max_batch_size <= 1:
+        return None
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            _generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait=float(os.getenv("HF_BATCH_MAX_WAIT_MS", "10")) / 1000,
+        )
+    return _batcher
+
+
+def batcher_status() -> Optional[dict]:
+    return _batcher.stats() if _batcher is not None else None
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker driven by error rate and latency.
+
+    Outcomes of the last `window_size` calls are kept in a rolling window. Once
+    at least `min_calls` have been seen, the breaker opens when the failure
+    rate or the slow-call rate crosses its threshold. While open every call is
+    rejected immediately; after `open_seconds` a limited number of half-open
+    probe calls are let through and their result decides whether the breaker
+    closes again or re-opens.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+
+        self.state = CLOSED
+        self._window = deque(maxlen=window_size)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.last_latency: Optional[float] = None
+
+    def _transition(self, state: str):
+        self.state = state
+        self._window.clear()
+        self._probes_in_flight = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                self.total_rejected += 1
+                return False
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.total_rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record_success(self, latency: float):
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float):
+        self._record(failed=True, latency=latency)
+
+    def release(self):
+        """
+        Give back a half-open probe slot for a call that never completed
+        """
+        if self.state == HALF_OPEN and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def _record(self, failed: bool, latency: float):
+        self.total_calls += 1
+        self.total_failures += failed
+        self.last_latency = latency
+        slow = latency >= self.slow_call_seconds
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._transition(OPEN if failed or slow else CLOSED)
+            return
+        if self.state == OPEN:
+            return
+
+        self._window.append((failed, slow))
+        if len(self._window) < self.min_calls:
+            return
+        calls = len(self._window)
+        failure_rate = sum(f for f, _ in self._window) / calls
+        slow_rate = sum(s for _, s in self._window) / calls
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._transition(OPEN)
+
+    async def call(self, factory: Callable[[], Awaitable], timeout: Optional[float] = None):
+        """
+        Run `factory()` through the breaker, cancelling it once `timeout` elapses
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        start = self._clock()
+        try:
+            result = await asyncio.wait_for(factory(), timeout=timeout)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure(self._clock() - start)
+            raise
+        self.record_success(self._clock() - start)
+        return result
+
+    def snapshot(self) -> dict:
+        calls = len(self._window)
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = max(0.0, self.open_seconds - (self._clock() - self._opened_at))
+        return {
+            "name": self.name,
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": sum(f for f, _ in self._window) / calls if calls else 0.0,
+            "slow_call_rate": sum(s for _, s in self._window) / calls if calls else 0.0,
+            "last_latency": self.last_latency,
+            "retry_in": retry_in,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(
+            name,
+            window_size=int(os.getenv("CB_WINDOW_SIZE", "20")),
+            min_calls=int(os.getenv("CB_MIN_CALLS", "5")),
+            failure_rate_threshold=float(os.getenv("CB_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("CB_SLOW_CALL_SECONDS", "10")),
+            slow_call_rate_threshold=float(os.getenv("CB_SLOW_CALL_RATE", "0.8")),
+            open_seconds=float(os.getenv("CB_OPEN_SECONDS", "30")),
+            half_open_max_calls=int(os.getenv("CB_HALF_OPEN_CALLS", "1")),
+        )
+    return _breakers[name]
+
+
+def breaker_status() -> list:
+    return [breaker.snapshot() for breaker in _breakers.values()]
@@ -0,0 +1,189 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Async drivers for each sync backend; the sync URL stays the single source of truth
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+DEFAULT_DATABASE_URL = "sqlite:///./healthcom.db"
+
+
+def normalize_database_url(url: str) -> str:
+    # Render hands out postgres:// URLs; SQLAlchemy 1.4+ only accepts postgresql://
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def get_database_url() -> str:
+    return normalize_database_url(os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL))
+
+
+def _is_memory_database(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _set_sqlite_pragmas(engine: Engine, in_memory: bool):
+    busy_timeout_ms = int(float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")) * 1000)
+    mmap_size = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    cache_size_kib = int(os.getenv("SQLITE_CACHE_SIZE_KIB", str(64 * 1024)))
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            # WAL lets readers proceed while a writer commits
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Safe with WAL: only the last commits can be lost on power failure, never corrupted
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={mmap_size}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.execute(f"PRAGMA cache_size=-{cache_size_kib}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+def _sqlite_engine(url: str, **kwargs) -> Engine:
+    in_memory = _is_memory_database(url)
+    connect_args = {
+        # Sessions are handed between threadpool threads; SQLAlchemy's pool
+        # guarantees a connection is only used by one thread at a time
+        "check_same_thread": False,
+        "timeout": float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")),
+    }
+    if in_memory:
+        # Every connection would otherwise get its own empty database
+        kwargs.setdefault("poolclass", StaticPool)
+    engine = create_engine(url, connect_args=connect_args, **kwargs)
+    _set_sqlite_pragmas(engine, in_memory)
+    return engine
+
+
+def _pool_settings(kwargs: dict) -> dict:
+    kwargs.setdefault("pool_size", int(os.getenv("DB_POOL_SIZE", "5")))
+    kwargs.setdefault("max_overflow", int(os.getenv("DB_MAX_OVERFLOW", "10")))
+    kwargs.setdefault("pool_timeout", float(os.getenv("DB_POOL_TIMEOUT", "30")))
+    kwargs.setdefault("pool_recycle", int(os.getenv("DB_POOL_RECYCLE", "1800")))
+    kwargs.setdefault("pool_pre_ping", os.getenv("DB_POOL_PRE_PING", "1") != "0")
+    return kwargs
+
+
+def _pooled_engine(url: str, **kwargs) -> Engine:
+    return create_engine(url, **_pool_settings(kwargs))
+
+
+def create_db_engine(url: str = None, **kwargs) -> Engine:
+    """
+    Create an engine tuned for the database backend in `url`.
+
+    SQLite gets WAL mode and connection pragmas; server databases such as
+    PostgreSQL get pool settings from DB_POOL_* environment variables.
+    Keyword arguments are passed to `create_engine` and win over both.
+    """
+    url = normalize_database_url(url or get_database_url())
+    if make_url(url).get_backend_name() == "sqlite":
+        return _sqlite_engine(url, **kwargs)
+    return _pooled_engine(url, **kwargs)
+
+
+# Bound to an engine by init_engine(); creating the engine is deferred until
+# startup so importing the app stays cheap and forked workers get their own pool
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+_engine = None
+
+
+def init_engine(url: str = None, **kwargs) -> Engine:
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine(url, **kwargs)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def get_engine() -> Engine:
+    return init_engine()
+
+
+def dispose_engine():
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def async_database_url(url: str = None) -> str:
+    """
+    The async-driver form of a database URL: sqlite+aiosqlite://, postgresql+asyncpg://
+    """
+    parsed = make_url(normalize_database_url(url or get_database_url()))
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: str = None, **kwargs):
+    """
+    Async counterpart of `create_db_engine`, with the same pragmas and pool settings
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(url)
+    if make_url(url).get_backend_name() == "sqlite":
+        in_memory = _is_memory_database(url)
+        if in_memory:
+            kwargs.setdefault("poolclass", StaticPool)
+        engine = create_async_engine(
+            url, connect_args={"timeout": float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))}, **kwargs
+        )
+        _set_sqlite_pragmas(engine.sync_engine, in_memory)
+        return engine
+    return create_async_engine(url, **_pool_settings(kwargs))
+
+
+_async_available = None
+AsyncSessionLocal = None
+_async_engine = None
+
+
+def async_enabled() -> bool:
+    """
+    Whether request handlers use the async engine (DB_ASYNC, default on when the driver is installed)
+    """
+    global _async_available
+    if os.getenv("DB_ASYNC", "1") == "0":
+        return False
+    if _async_available is None:
+        backend = make_url(get_database_url()).get_backend_name()
+        try:
+            __import__(ASYNC_DRIVERS[backend])
+            _async_available = True
+        except (KeyError, ImportError) as e:
+            print(f"Async database driver unavailable ({e}), using the sync engine")
+            _async_available = False
+    return _async_available
+
+
+def init_async_engine(url: str = None, **kwargs):
+    global _async_engine, AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_engine = create_async_db_engine(url, **kwargs)
+        # Objects stay usable after commit without a lazy reload, which async sessions can't do implicitly
+        AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+def get_async_engine():
+    return init_async_engine()
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
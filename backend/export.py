@@ -0,0 +1,166 @@
+"""
+Streaming export of conversation history for clinical audits.
+
+Rows are read through a server-side cursor (`stream_results` / `yield_per`)
+and encoded one partition at a time, so memory stays flat however many
+messages match. Output is NDJSON or CSV, optionally gzipped on the fly.
+
+Rows come out in message id order and every row carries its id, so an
+interrupted export resumes with `after=<last id received>`.
+
+    python -m backend.export --location Zomba --since 2026-01-01 --format csv --out audit.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from .models import Conversation, Message, User
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+COLUMNS = ("id", "conversation_id", "conversation_title", "user_id", "location", "role", "content", "timestamp")
+
+
+class ExportFilter:
+    """
+    Which messages to export; every field is optional and they combine with AND
+    """
+    __slots__ = ("user_id", "location", "since", "until", "after")
+
+    def __init__(self, user_id: Optional[int] = None, location: Optional[str] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None, after: Optional[int] = None):
+        self.user_id = user_id
+        self.location = location
+        self.since = since
+        self.until = until
+        self.after = after
+
+    def query(self):
+        query = (
+            select(Message.id, Message.conversation_id, Conversation.title, Conversation.user_id, User.location,
+                   Message.role, Message.content, Message.timestamp)
+            .join(Conversation, Message.conversation_id == Conversation.id)
+            .join(User, Conversation.user_id == User.id)
+            .order_by(Message.id)
+        )
+        if self.user_id is not None:
+            query = query.where(Conversation.user_id == self.user_id)
+        if self.location is not None:
+            query = query.where(User.location == self.location)
+        if self.since is not None:
+            query = query.where(Message.timestamp >= self.since)
+        if self.until is not None:
+            query = query.where(Message.timestamp < self.until)
+        if self.after is not None:
+            query = query.where(Message.id > self.after)
+        return query
+
+
+def _values(row) -> tuple:
+    timestamp = row[-1]
+    return tuple(row[:-1]) + (timestamp.isoformat() if timestamp else None,)
+
+
+def _ndjson(rows) -> str:
+    return "".join(json.dumps(dict(zip(COLUMNS, _values(row))), ensure_ascii=False) + "\n" for row in rows)
+
+
+def _csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(_values(row) for row in rows)
+    return buffer.getvalue()
+
+
+class Encoder:
+    """
+    Turns partitions of rows into output bytes, gzipping across chunk boundaries when asked
+    """
+
+    def __init__(self, format: str = "ndjson", compress: bool = False):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format {format!r}")
+        self.format = format
+        # wbits=31 writes a gzip header and trailer, so the stream is a regular .gz file
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def _out(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        return self._compressor.compress(data) if self._compressor else data
+
+    def header(self) -> bytes:
+        return self._out(",".join(COLUMNS) + "\r\n" if self.format == "csv" else "")
+
+    def encode(self, rows) -> bytes:
+        return self._out(_csv(rows) if self.format == "csv" else _ndjson(rows))
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+
+def stream_export(engine, export_filter: ExportFilter, encoder: Encoder, chunk_rows: int = 1000) -> Iterator[bytes]:
+    """
+    Encoded chunks of the export, read through a server-side cursor on a connection of its own
+    """
+    yield encoder.header()
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(export_filter.query())
+        for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+async def stream_export_async(engine, export_filter: ExportFilter, encoder: Encoder, chunk_rows: int = 1000):
+    yield encoder.header()
+    async with engine.connect() as conn:
+        result = await conn.stream(export_filter.query().execution_options(yield_per=chunk_rows))
+        async for rows in result.partitions():
+            # Encoding (and gzipping) a partition is CPU work; keep it off the event loop
+            chunk = await asyncio.to_thread(encoder.encode, rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+def _date(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main():
+    from dotenv import load_dotenv
+    from .database import init_engine
+
+    parser = argparse.ArgumentParser(description="Export conversation history as NDJSON or CSV")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--location")
+    parser.add_argument("--since", type=_date, help="ISO date or datetime, inclusive")
+    parser.add_argument("--until", type=_date, help="ISO date or datetime, exclusive")
+    parser.add_argument("--after", type=int, help="resume after this message id")
+    parser.add_argument("--out", help="output file (default stdout); a .gz name is gzipped")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--chunk-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    load_dotenv()
+    export_filter = ExportFilter(args.user_id, args.location, args.since, args.until, args.after)
+    encoder = Encoder(args.format, compress=args.gzip or bool(args.out and args.out.endswith(".gz")))
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in stream_export(init_engine(), export_filter, encoder, args.chunk_rows):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+from .workers import available_cores, worker_share
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+def bcrypt_rounds() -> int:
+    return int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != bcrypt_rounds()
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class HashingPool:
+    """
+    Runs bcrypt on a dedicated process pool with bounded admission.
+
+    At most `max_pending` hashes may be queued or running at once; further
+    calls fail fast with HashingBusyError instead of piling up and holding
+    request threads. With `max_workers=0` hashing runs inline.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forkserver keeps the parent's threads and sockets out of the workers
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(method),
+                )
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.max_workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusyError("Password hashing is saturated")
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    async def run_async(self, fn, *args):
+        """
+        `run` for the event loop: awaits the worker process without holding a thread
+        """
+        if self.max_workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusyError("Password hashing is saturated")
+        try:
+            return await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_pool: Optional[HashingPool] = None
+
+
+def get_pool() -> HashingPool:
+    """
+    This worker's hashing pool. HASH_WORKERS and HASH_MAX_PENDING are totals
+    for the server, split across its WEB_CONCURRENCY workers
+    """
+    global _pool
+    if _pool is None:
+        workers = int(os.getenv("HASH_WORKERS", str(available_cores())))
+        _pool = HashingPool(
+            max_workers=worker_share(workers),
+            max_pending=worker_share(int(os.getenv("HASH_MAX_PENDING", str(max(1, workers) * 4)))),
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def hash_password(password: str) -> str:
+    return get_pool().run(_hash, password.encode("utf-8"), bcrypt_rounds()).decode("utf-8")
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return get_pool().run(_check, plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+async def hash_password_async(password: str) -> str:
+    hashed = await get_pool().run_async(_hash, password.encode("utf-8"), bcrypt_rounds())
+    return hashed.decode("utf-8")
+
+
+async def check_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await get_pool().run_async(_check, plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
@@ -0,0 +1,361 @@
+import base64
+import os
+import queue
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import analytics
+from .models import Conversation, Message
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    Request handlers enqueue rows and return immediately; a background thread
+    drains the queue and writes each batch with one multi-row INSERT and one
+    commit. `stop()` flushes everything still queued before returning.
+
+    User messages are tagged with their symptom category on the way, and the
+    batch's counts go into the analytics rollups in the same transaction, so
+    the rollups always match the stored messages.
+    """
+
+    def __init__(self, session_factory, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue: int = 10000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rollup_failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, conversation_id: int, user_id: int, role: str, content: str,
+                timestamp: Optional[datetime] = None, location: Optional[str] = None) -> bool:
+        row = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "role": role,
+            "content": content,
+            "timestamp": timestamp or datetime.utcnow(),
+            "category": None,
+            "location": None,
+        }
+        try:
+            self._queue.put_nowait((row, location))
+        except queue.Full:
+            self.dropped += 1
+            print("Message writer queue is full, dropping message")
+            return False
+        return True
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: list):
+        rows, counts = [], Counter()
+        for row, location in batch:
+            if row["role"] == "user":
+                row["category"] = analytics.classify(row["content"])
+                # Stored as counted, so a backfill attributes the message to the same location
+                row["location"] = location or analytics.UNKNOWN_LOCATION
+                key = analytics.rollup_key(row["timestamp"], row["location"], row["category"])
+                if key is not None:
+                    counts[key] += 1
+            rows.append(row)
+
+        if self._write(rows, counts):
+            return
+        if counts:
+            # Keep the messages even if the rollups can't be updated; a backfill repairs them
+            self.rollup_failed += len(rows)
+            self._write(rows, Counter())
+
+    def _write(self, rows: list, counts: Counter) -> bool:
+        db = self.session_factory()
+        try:
+            db.execute(insert(Message), rows)
+            conversation_ids = {row["conversation_id"] for row in rows}
+            db.execute(
+                update(Conversation)
+                .where(Conversation.id.in_(conversation_ids))
+                .values(updated_at=max(row["timestamp"] for row in rows))
+            )
+            analytics.apply_counts(db, counts)
+            db.commit()
+            self.written += len(rows)
+            return True
+        except Exception as e:
+            db.rollback()
+            if not counts:
+                self.failed += len(rows)
+            print(f"Failed to write {len(rows)} messages: {e}")
+            return False
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "rollup_failed": self.rollup_failed,
+        }
+
+
+writer: Optional[MessageWriter] = None
+
+
+def start_writer(session_factory) -> MessageWriter:
+    global writer
+    writer = MessageWriter(
+        session_factory,
+        batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+        flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5")),
+        max_queue=int(os.getenv("HISTORY_MAX_QUEUE", "10000")),
+    )
+    writer.start()
+    return writer
+
+
+def stop_writer():
+    global writer
+    if writer is not None:
+        writer.stop()
+        writer = None
+
+
+def record_exchange(conversation_id: int, user_id: int, user_message: str, ai_response: str,
+                    asked_at: datetime, location: Optional[str] = None):
+    """
+    Queue both sides of one consultation exchange for persistence; `location`
+    is the user's location, for the symptom rollups
+    """
+    if writer is None:
+        print("Message writer is not running, conversation history not saved")
+        return
+    writer.enqueue(conversation_id, user_id, "user", user_message, asked_at, location)
+    writer.enqueue(conversation_id, user_id, "assistant", ai_response)
+
+
+# Conversations never change owner, so ownership checks can be remembered
+_conversation_owners = OrderedDict()
+_MAX_KNOWN_CONVERSATIONS = 10000
+
+
+def _remember_owner(conversation_id: int, user_id: int):
+    _conversation_owners[conversation_id] = user_id
+    _conversation_owners.move_to_end(conversation_id)
+    while len(_conversation_owners) > _MAX_KNOWN_CONVERSATIONS:
+        _conversation_owners.popitem(last=False)
+
+
+def known_conversation(user_id: int, conversation_id: Optional[int]) -> bool:
+    return conversation_id is not None and _conversation_owners.get(conversation_id) == user_id
+
+
+def resolve_conversation(db: Session, user_id: int, conversation_id: Optional[int],
+                         title: str = "Health Consultation") -> int:
+    """
+    Return the conversation to append to, starting a new one when none is given
+    """
+    if conversation_id is not None:
+        if known_conversation(user_id, conversation_id):
+            return conversation_id
+        _check_owner(db.execute(_owner_query(conversation_id)).scalar(), user_id)
+        _remember_owner(conversation_id, user_id)
+        return conversation_id
+
+    conversation = Conversation(user_id=user_id, title=title)
+    db.add(conversation)
+    db.commit()
+    _remember_owner(conversation.id, user_id)
+    return conversation.id
+
+
+async def resolve_conversation_async(db: AsyncSession, user_id: int, conversation_id: Optional[int],
+                                     title: str = "Health Consultation") -> int:
+    if conversation_id is not None:
+        if known_conversation(user_id, conversation_id):
+            return conversation_id
+        _check_owner((await db.execute(_owner_query(conversation_id))).scalar(), user_id)
+        _remember_owner(conversation_id, user_id)
+        return conversation_id
+
+    conversation = Conversation(user_id=user_id, title=title)
+    db.add(conversation)
+    await db.commit()
+    _remember_owner(conversation.id, user_id)
+    return conversation.id
+
+
+def _unknown_conversations(requests: List[Tuple[int, Optional[int]]]) -> set:
+    return {conversation_id for user_id, conversation_id in requests
+            if conversation_id is not None and not known_conversation(user_id, conversation_id)}
+
+
+def _assign_conversations(requests: List[Tuple[int, Optional[int]]], created_ids: List[int]) -> List[Optional[int]]:
+    created = iter(created_ids)
+    resolved = []
+    for user_id, conversation_id in requests:
+        if conversation_id is None:
+            conversation_id = next(created)
+            _remember_owner(conversation_id, user_id)
+        elif not known_conversation(user_id, conversation_id):
+            conversation_id = None
+        resolved.append(conversation_id)
+    return resolved
+
+
+def resolve_conversations(db: Session, requests: List[Tuple[int, Optional[int]]],
+                          title: str = "Health Consultation") -> List[Optional[int]]:
+    """
+    resolve_conversation for many (user_id, conversation_id) pairs with one
+    ownership query and one commit; None where the conversation is not the user's
+    """
+    unknown = _unknown_conversations(requests)
+    if unknown:
+        for conversation_id, owner in db.execute(_owners_query(unknown)):
+            _remember_owner(conversation_id, owner)
+    created = [Conversation(user_id=user_id, title=title) for user_id, conversation_id in requests
+               if conversation_id is None]
+    created_ids = []
+    if created:
+        db.add_all(created)
+        # Read the ids before the commit expires them, or each one costs a SELECT
+        db.flush()
+        created_ids = [conversation.id for conversation in created]
+        db.commit()
+    return _assign_conversations(requests, created_ids)
+
+
+async def resolve_conversations_async(db: AsyncSession, requests: List[Tuple[int, Optional[int]]],
+                                      title: str = "Health Consultation") -> List[Optional[int]]:
+    unknown = _unknown_conversations(requests)
+    if unknown:
+        for conversation_id, owner in await db.execute(_owners_query(unknown)):
+            _remember_owner(conversation_id, owner)
+    created = [Conversation(user_id=user_id, title=title) for user_id, conversation_id in requests
+               if conversation_id is None]
+    created_ids = []
+    if created:
+        db.add_all(created)
+        await db.flush()
+        created_ids = [conversation.id for conversation in created]
+        await db.commit()
+    return _assign_conversations(requests, created_ids)
+
+
+def _owner_query(conversation_id: int):
+    return select(Conversation.user_id).where(Conversation.id == conversation_id)
+
+
+def _owners_query(conversation_ids):
+    return select(Conversation.id, Conversation.user_id).where(Conversation.id.in_(conversation_ids))
+
+
+def _check_owner(owner: Optional[int], user_id: int):
+    if owner is None or owner != user_id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+
+def encode_cursor(message: Message) -> str:
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_message_page(db: Session, conversation_id: int, user_id: int, limit: int = 50,
+                     after: Optional[str] = None, before: Optional[str] = None) -> dict:
+    """
+    One page of a conversation in chronological order, using keyset pagination.
+
+    Without a cursor the newest `limit` messages are returned. `before` walks
+    back through older history and `after` walks forward to newer messages;
+    `next_cursor` continues in the same direction. Pages not fetched with
+    `before` also return `newer_cursor`, the newest message's position: pass
+    it as `after` to get what was written since, e.g. to poll the newest page
+    for new messages. Both seek on the
+    (conversation_id, timestamp) index instead of scanning past skipped rows
+    with OFFSET.
+    """
+    _check_owner(db.execute(_owner_query(conversation_id)).scalar(), user_id)
+    rows = list(db.execute(_page_query(conversation_id, limit, after, before)).scalars())
+    return _page(rows, limit, after, before)
+
+
+async def get_message_page_async(db: AsyncSession, conversation_id: int, user_id: int, limit: int = 50,
+                                 after: Optional[str] = None, before: Optional[str] = None) -> dict:
+    _check_owner((await db.execute(_owner_query(conversation_id))).scalar(), user_id)
+    rows = list((await db.execute(_page_query(conversation_id, limit, after, before))).scalars())
+    return _page(rows, limit, after, before)
+
+
+def _page_query(conversation_id: int, limit: int, after: Optional[str], before: Optional[str]):
+    query = select(Message).where(Message.conversation_id == conversation_id)
+    position = tuple_(Message.timestamp, Message.id)
+    if after is not None:
+        query = query.where(position > tuple_(*decode_cursor(after)))
+        query = query.order_by(Message.timestamp.asc(), Message.id.asc())
+    else:
+        if before is not None:
+            query = query.where(position < tuple_(*decode_cursor(before)))
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    return query.limit(limit + 1)
+
+
+def _page(rows: list, limit: int, after: Optional[str], before: Optional[str]) -> dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+
+    # next_cursor continues in the direction being paged: older for `before`, newer for `after`
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1] if after is not None else rows[0])
+    # An older (`before`) page is followed by messages the client already has
+    newer_cursor = None
+    if before is None:
+        newer_cursor = encode_cursor(rows[-1]) if rows else after
+    return {"messages": rows, "next_cursor": next_cursor, "newer_cursor": newer_cursor}
@@ -0,0 +1,188 @@
+import json
+import os
+from typing import List, Optional
+
+DEFAULT_HF_API_URL = "https://api-inference.huggingface.co/models/medalpaca/medalpaca-7b"
+
+DEFAULT_PARAMETERS = {
+    "max_new_tokens": 300,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "do_sample": True
+}
+
+
+class InferenceError(Exception):
+    pass
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_generated_text(result) -> str:
+    """
+    Extract the answer from a Hugging Face text-generation payload
+    """
+    if isinstance(result, list):
+        if not result:
+            return ""
+        result = result[0]
+    generated_text = result.get("generated_text", "") if isinstance(result, dict) else ""
+    # Extract only the answer part after the question
+    if "Answer:" in generated_text:
+        return generated_text.split("Answer:")[-1].strip()
+    return generated_text.strip()
+
+
+class InferenceClient:
+    """
+    Async Hugging Face inference client sharing one keep-alive connection pool.
+
+    Connections are reused across requests (HTTP/2 when the `h2` package is
+    installed and the server negotiates it), so many in-flight consultations
+    can share one event loop instead of each holding a worker thread.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        transport=None,
+    ):
+        # httpx is imported on first use so importing the app stays fast
+        import httpx
+
+        self.api_url = api_url
+        self.api_key = api_key
+        self.http2 = http2 and _http2_available()
+
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        self._client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=self.http2,
+            # An httpx transport to use instead of the network, e.g. httpx.MockTransport for a stub backend
+            transport=transport,
+        )
+
+    @classmethod
+    def from_env(cls) -> "InferenceClient":
+        return cls(
+            api_url=os.getenv("HF_API_URL", DEFAULT_HF_API_URL),
+            api_key=os.getenv("HF_API_KEY"),
+            timeout=float(os.getenv("HF_TIMEOUT", "60")),
+            max_connections=int(os.getenv("HF_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HF_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("HF_POOL_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("HF_HTTP2", "1") != "0",
+        )
+
+    async def generate(self, prompt: str, parameters: Optional[dict] = None) -> str:
+        data = {
+            "inputs": prompt,
+            "parameters": parameters or DEFAULT_PARAMETERS,
+            "options": {
+                "wait_for_model": True
+            }
+        }
+        response = await self._client.post(self.api_url, json=data)
+        if response.status_code != 200:
+            raise InferenceError(f"Inference backend returned {response.status_code}")
+        return parse_generated_text(response.json())
+
+    async def generate_batch(self, prompts: List[str], parameters: Optional[dict] = None) -> List[str]:
+        """
+        Generate answers for several prompts in one request
+        """
+        if len(prompts) == 1:
+            return [await self.generate(prompts[0], parameters)]
+        data = {
+            "inputs": prompts,
+            "parameters": parameters or DEFAULT_PARAMETERS,
+            "options": {
+                "wait_for_model": True
+            }
+        }
+        response = await self._client.post(self.api_url, json=data)
+        if response.status_code != 200:
+            raise InferenceError(f"Inference backend returned {response.status_code}")
+        results = response.json()
+        if not isinstance(results, list) or len(results) != len(prompts):
+            raise InferenceError("Inference backend returned a malformed batch response")
+        return [parse_generated_text(result) for result in results]
+
+    async def stream(self, prompt: str, parameters: Optional[dict] = None):
+        """
+        Yield generated text as the backend produces it.
+
+        Backends that answer a `"stream": true` request with server-sent events
+        are streamed token by token; anything else is yielded as one chunk.
+        """
+        data = {
+            "inputs": prompt,
+            "parameters": parameters or DEFAULT_PARAMETERS,
+            "options": {
+                "wait_for_model": True
+            },
+            "stream": True
+        }
+        async with self._client.stream("POST", self.api_url, json=data) as response:
+            if response.status_code != 200:
+                raise InferenceError(f"Inference backend returned {response.status_code}")
+
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                await response.aread()
+                text = parse_generated_text(response.json())
+                if text:
+                    yield text
+                return
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if not payload or payload == "[DONE]":
+                    continue
+                token = json.loads(payload).get("token") or {}
+                if token.get("special"):
+                    continue
+                if token.get("text"):
+                    yield token["text"]
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client: Optional[InferenceClient] = None
+
+
+def get_client() -> InferenceClient:
+    global _client
+    if _client is None:
+        _client = InferenceClient.from_env()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,65 +1,147 @@
-from fastapi import FastAPI, Depends, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-import bcrypt
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
-from .models import Base, User, Conversation, Message, UserCreate, UserResponse, LoginRequest, LoginResponse, ChatRequest, ChatResponse
-from datetime import datetime
-from typing import Optional
-import requests
-
-# Load environment variables
-load_dotenv()
-
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./healthcom.db")
-
-# For PostgreSQL support on Render, update the URL if needed
-if DATABASE_URL.startswith("postgres://"):
-    # Convert postgres:// to postgresql:// for SQLAlchemy 1.4+ compatibility
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="HealthCo API",
-    description="A healthcare application backend with AI doctor functionality",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with your frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Dependency to get database session
-def get_db():
+from .models import (UserCreate, UserResponse, LoginRequest, LoginResponse, ChatRequest, ChatResponse, ChatBatchRequest,
+                     ChatBatchResponse, ChatBatchResult, MessagePage)
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Union
+import asyncio
+import hmac
+import json
+import time
+from . import analytics, database, export, hashing, history, inference, retrieval
+from .database import SessionLocal
+from .admission import AdmissionRejected, admission_status, classify_priority, get_rate_limiter
+from .batching import batcher_status
+from .metrics import (CONTENT_TYPE, MetricsMiddleware, render_latest, stage_duration, start_sharing, stop_sharing,
+                      timed)
+from .circuit_breaker import breaker_status
+from .profile_cache import get_profile_cache, start_invalidation_polling, stop_invalidation_polling
+from .response_cache import get_cache
+from .static_files import StaticAssets, static_directory
+from .auth import (authenticate_user, authenticate_user_async, create_user, create_user_async, get_user_profile,
+                   get_user_profile_async, load_profile_record, load_profile_record_async, load_profile_records,
+                   load_profile_records_async)
+from .ai_doctor import get_ai_response, stream_ai_response
+
+router = APIRouter()
+
+DbSession = Union[Session, AsyncSession]
+
+# Dependency to get database session: an AsyncSession with DB_ASYNC on, otherwise a sync Session
+async def get_db():
+    start = time.perf_counter()
+    if database.async_enabled():
+        async with database.AsyncSessionLocal() as db:
+            try:
+                yield db
+            finally:
+                stage_duration.observe(time.perf_counter() - start, "db_session")
+        return
+
     db = SessionLocal()
     try:
         yield db
     finally:
+        # run_db already returned the connection; this only discards the session state
+        db.close()
+        stage_duration.observe(time.perf_counter() - start, "db_session")
+
+def _run_and_release(sync_fn, db: Session, *args):
+    try:
+        return sync_fn(db, *args)
+    finally:
+        # Hand the connection back before the thread is freed; waiting for another
+        # thread to close it can deadlock once every thread is waiting on the pool
         db.close()
 
+async def run_db(db, sync_fn, async_fn, *args):
+    """
+    Await `async_fn` on an AsyncSession; run `sync_fn` in the threadpool on a sync Session
+    """
+    if isinstance(db, AsyncSession):
+        try:
+            return await async_fn(db, *args)
+        finally:
+            # Like the sync path, don't hold a pooled connection while waiting on the model
+            await db.close()
+    return await run_in_threadpool(_run_and_release, sync_fn, db, *args)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything with side effects happens here, once per worker process, rather than at import
+    load_dotenv()
+    engine = database.init_engine()
+    if os.getenv("AUTO_MIGRATE") == "1":
+        # Convenience for local development; deploys run `python -m backend.migrate`
+        from .migrate import create_schema
+        create_schema(engine)
+    if database.async_enabled():
+        database.init_async_engine()
+    # The write-behind history writer is a thread and keeps using the sync engine
+    history.start_writer(SessionLocal)
+    # With several workers, publish this one's metrics so any of them can answer a scrape
+    start_sharing()
+    # Profile edits made by other workers reach this one's cache through a polling thread
+    start_invalidation_polling()
+    # Build (or memory-map) the offline retrieval index before the first fallback answer needs it
+    retrieval.get_doctor()
+    try:
+        yield
+    finally:
+        await inference.close_client()
+        history.stop_writer()
+        stop_sharing()
+        stop_invalidation_polling()
+        hashing.shutdown_pool()
+        await database.dispose_async_engine()
+        database.dispose_engine()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="HealthCo API",
+        description="A healthcare application backend with AI doctor functionality",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, replace with your frontend URL
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Request counts and latency by route and status, exposed at /metrics
+    if os.getenv("METRICS_ENABLED", "1") != "0":
+        app.add_middleware(MetricsMiddleware)
+
+    app.include_router(router)
+    # The frontend calls `/api/...` when it is served from the same origin
+    app.include_router(router, prefix="/api", include_in_schema=False)
+
+    # Frontend last, so API routes always win
+    directory = static_directory()
+    if directory:
+        app.mount("/", StaticAssets(directory), name="static")
+    return app
 
-# Import authentication functions
-from auth import authenticate_user, create_user, get_user_profile, verify_password, get_password_hash
-from ai_doctor import get_ai_response
 
 # API Endpoints
-@app.post("/users/register", response_model=LoginResponse)
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+@router.post("/users/register", response_model=LoginResponse)
+async def register_user(user_data: UserCreate, db: DbSession = Depends(get_db)):
     try:
-        db_user = create_user(db, user_data)
+        db_user = await run_db(db, create_user, create_user_async, user_data)
         return LoginResponse(
             user_id=db_user.id,
             username=db_user.username,
@@ -70,9 +152,9 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
-@app.post("/users/login", response_model=LoginResponse)
-def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = authenticate_user(db, login_data.username, login_data.password)
+@router.post("/users/login", response_model=LoginResponse)
+async def login_user(login_data: LoginRequest, db: DbSession = Depends(get_db)):
+    user = await run_db(db, authenticate_user, authenticate_user_async, login_data.username, login_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
@@ -82,28 +164,243 @@ def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
         message="Login successful"
     )
 
-@app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = get_user_profile(db, user_id)
+@router.get("/users/{user_id}", response_model=UserResponse)
+async def get_user(user_id: int, db: DbSession = Depends(get_db)):
+    user = await run_db(db, get_user_profile, get_user_profile_async, user_id)
     return user
 
-@app.post("/chat/message", response_model=ChatResponse)
-def chat_with_doctor(chat_data: ChatRequest, db: Session = Depends(get_db)):
-    # Get the user to provide context
-    user = get_user_profile(db, chat_data.user_id)
-    user_context = {
-        "full_name": user.full_name,
-        "age": user.age,
-        "location": user.location
-    }
+def _load_chat_context(db: Session, chat_data: ChatRequest, profile=None):
+    # Get the user to provide context and the conversation the exchange belongs to
+    if profile is None:
+        profile = load_profile_record(db, chat_data.user_id)
+    conversation_id = history.resolve_conversation(db, profile.id, chat_data.conversation_id)
+    return profile.to_context(), conversation_id
+
+async def _load_chat_context_async(db: AsyncSession, chat_data: ChatRequest, profile=None):
+    if profile is None:
+        profile = await load_profile_record_async(db, chat_data.user_id)
+    conversation_id = await history.resolve_conversation_async(db, profile.id, chat_data.conversation_id)
+    return profile.to_context(), conversation_id
+
+async def load_chat_context(db: DbSession, chat_data: ChatRequest):
+    with timed("profile_lookup"):
+        # Cached profile in an already-known conversation: no database access at all
+        profile = get_profile_cache().get(chat_data.user_id)
+        if profile is not None and history.known_conversation(chat_data.user_id, chat_data.conversation_id):
+            return profile.to_context(), chat_data.conversation_id
+        # Otherwise DB access stays off the event loop
+        return await run_db(db, _load_chat_context, _load_chat_context_async, chat_data, profile)
+
+def _too_busy(rejection: AdmissionRejected, status_code: int = 503) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=f"The AI doctor is busy ({rejection.reason}), please try again shortly",
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+def admit_chat(chat_data: ChatRequest) -> int:
+    """
+    Triage the message and apply the sender's rate limit; returns the queue priority
+    """
+    priority = classify_priority(chat_data.message)
+    try:
+        # Urgent messages have their own, larger allowance
+        get_rate_limiter(priority).check(chat_data.user_id)
+    except AdmissionRejected as e:
+        raise _too_busy(e, status_code=429)
+    return priority
 
-    # Get AI response
-    ai_response = get_ai_response(chat_data.message, user_context)
+@router.post("/chat/message", response_model=ChatResponse)
+async def chat_with_doctor(chat_data: ChatRequest, db: DbSession = Depends(get_db)):
+    asked_at = datetime.utcnow()
+    priority = admit_chat(chat_data)
+    user_context, conversation_id = await load_chat_context(db, chat_data)
 
-    # Create conversation and save message (optional, for history)
-    # For this implementation, we'll just return the AI response
-    return ChatResponse(response=ai_response)
+    # Get AI response without blocking the event loop
+    try:
+        with timed("ai_response"):
+            ai_response = await get_ai_response(chat_data.message, user_context,
+                                                use_cache=chat_data.use_cache, priority=priority)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+
+    # Save the exchange through the write-behind queue; no commit on the response path
+    history.record_exchange(conversation_id, chat_data.user_id, chat_data.message, ai_response, asked_at,
+                            user_context.get("location"))
+    with timed("serialization"):
+        return Response(
+            ChatResponse(response=ai_response, conversation_id=conversation_id).model_dump_json(),
+            media_type="application/json"
+        )
+
+def _load_batch_context(db: Session, items: List[ChatRequest]):
+    profiles = load_profile_records(db, {item.user_id for item in items})
+    valid = [index for index, item in enumerate(items) if item.user_id in profiles]
+    conversations = history.resolve_conversations(
+        db, [(items[index].user_id, items[index].conversation_id) for index in valid])
+    return profiles, dict(zip(valid, conversations))
+
+async def _load_batch_context_async(db: AsyncSession, items: List[ChatRequest]):
+    profiles = await load_profile_records_async(db, {item.user_id for item in items})
+    valid = [index for index, item in enumerate(items) if item.user_id in profiles]
+    conversations = await history.resolve_conversations_async(
+        db, [(items[index].user_id, items[index].conversation_id) for index in valid])
+    return profiles, dict(zip(valid, conversations))
+
+def _batch_error(index: int, error: HTTPException) -> ChatBatchResult:
+    retry_after = (error.headers or {}).get("Retry-After")
+    return ChatBatchResult(index=index, status_code=error.status_code, error=str(error.detail),
+                           retry_after=int(retry_after) if retry_after else None)
+
+@router.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatchRequest, db: DbSession = Depends(get_db)):
+    """
+    Many messages in one request (SMS and kiosk gateways). Results come back in
+    request order; a failed item carries its own status code instead of
+    failing the batch.
+    """
+    max_items = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "100"))
+    if len(batch.items) > max_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_items} messages per batch")
+    asked_at = datetime.utcnow()
+
+    # Every user in one IN query and every conversation check in another, instead of per item
+    with timed("profile_lookup"):
+        profiles, conversations = await run_db(db, _load_batch_context, _load_batch_context_async, batch.items)
+
+    # Bound how much of the model backend a single batch can occupy at once
+    limit = asyncio.Semaphore(int(os.getenv("CHAT_BATCH_CONCURRENCY", "8")))
+
+    async def answer(index: int, item: ChatRequest) -> ChatBatchResult:
+        profile = profiles.get(item.user_id)
+        if profile is None:
+            return ChatBatchResult(index=index, status_code=404, error="User not found")
+        conversation_id = conversations[index]
+        if conversation_id is None:
+            return ChatBatchResult(index=index, status_code=404, error="Conversation not found")
+        try:
+            priority = admit_chat(item)
+            async with limit:
+                with timed("ai_response"):
+                    ai_response = await get_ai_response(item.message, profile.to_context(),
+                                                        use_cache=item.use_cache, priority=priority)
+        except HTTPException as e:
+            return _batch_error(index, e)
+        except AdmissionRejected as e:
+            return _batch_error(index, _too_busy(e))
+        except Exception as e:
+            print(f"Batch item {index} failed: {e}")
+            return ChatBatchResult(index=index, status_code=500, error="Could not answer this message")
+        history.record_exchange(conversation_id, item.user_id, item.message, ai_response, asked_at, profile.location)
+        return ChatBatchResult(index=index, response=ai_response, conversation_id=conversation_id)
+
+    results = await asyncio.gather(*(answer(index, item) for index, item in enumerate(batch.items)))
+    with timed("serialization"):
+        return Response(ChatBatchResponse(results=results).model_dump_json(), media_type="application/json")
+
+@router.post("/chat/stream")
+async def stream_chat_with_doctor(chat_data: ChatRequest, db: DbSession = Depends(get_db)):
+    asked_at = datetime.utcnow()
+    priority = admit_chat(chat_data)
+    # Look the user up before streaming starts so a bad user_id is still a 404
+    user_context, conversation_id = await load_chat_context(db, chat_data)
+
+    # Wait for the first chunk before sending headers so a full queue is still a 503
+    chunks = stream_ai_response(chat_data.message, user_context, use_cache=chat_data.use_cache, priority=priority)
+    try:
+        first = await chunks.__anext__()
+    except AdmissionRejected as e:
+        raise _too_busy(e)
 
-@app.get("/health")
+    async def events():
+        parts = [first]
+        try:
+            yield f"data: {json.dumps({'text': first})}\n\n"
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield f"data: {json.dumps({'text': chunk})}\n\n"
+        finally:
+            # Frees the model slot even if the client disconnects mid-stream
+            await chunks.aclose()
+        history.record_exchange(conversation_id, chat_data.user_id, chat_data.message, "".join(parts).strip(), asked_at,
+                                user_context.get("location"))
+        yield f"event: done\ndata: {json.dumps({'conversation_id': conversation_id})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(conversation_id: int, user_id: int, limit: int = Query(50, ge=1, le=200),
+                                    before: Optional[str] = None, after: Optional[str] = None,
+                                    db: DbSession = Depends(get_db)):
+    return await run_db(db, history.get_message_page, history.get_message_page_async,
+                        conversation_id, user_id, limit, after, before)
+
+def _check_export_token(token: Optional[str]):
+    expected = os.getenv("EXPORT_TOKEN")
+    # Without a configured token the export does not exist
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=403, detail="Invalid export token")
+
+@router.get("/export/messages")
+async def export_messages(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), user_id: Optional[int] = None,
+                          location: Optional[str] = None, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, after: Optional[int] = None, gzip: bool = False,
+                          x_export_token: Optional[str] = Header(None)):
+    """
+    Stream matching messages as NDJSON or CSV in id order; resume with `after` set to the last id received
+    """
+    _check_export_token(x_export_token)
+    export_filter = export.ExportFilter(user_id, location, since, until, after)
+    encoder = export.Encoder(format, compress=gzip)
+    chunk_rows = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+    if database.async_enabled():
+        chunks = export.stream_export_async(database.get_async_engine(), export_filter, encoder, chunk_rows)
+    else:
+        # A sync generator: Starlette pulls each chunk in the threadpool, off the event loop
+        chunks = export.stream_export(database.get_engine(), export_filter, encoder, chunk_rows)
+    filename = f"messages.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+@router.get("/analytics/symptoms")
+async def symptom_trends(days: int = Query(14, ge=1, le=366), location: Optional[str] = None,
+                         until: Optional[date] = None, db: DbSession = Depends(get_db)):
+    """
+    Symptom categories per location and day over the last `days` days, from
+    the rollup tables; categories rising most against the previous period first
+    """
+    until = until or datetime.utcnow().date() + timedelta(days=1)
+    return await run_db(db, analytics.symptom_trends, analytics.symptom_trends_async, days, until, location)
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    # Sync on purpose: FastAPI runs it in the threadpool, so reading the workers' snapshot files never blocks the loop
+    return Response(render_latest(), media_type=CONTENT_TYPE)
+
+@router.get("/health")
 def health_check():
-    return {"status": "healthy", "message": "HealthCo API is running"}
\ No newline at end of file
+    return {"status": "healthy", "message": "HealthCo API is running"}
+
+@router.get("/ai/status")
+def ai_status():
+    cache = get_cache()
+    return {
+        "breakers": breaker_status(),
+        "admission": admission_status(),
+        "batching": batcher_status(),
+        "history": history.writer.stats() if history.writer is not None else None,
+        "profiles": get_profile_cache().stats(),
+        "cache": cache.stats() if cache is not None else None
+    }
+
+
+app = create_app()
\ No newline at end of file
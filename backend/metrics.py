@@ -0,0 +1,394 @@
+"""
+Prometheus metrics kept in-process, with optional aggregation across workers.
+
+With several worker processes a scrape lands on whichever worker accepts it.
+When METRICS_MULTIPROC_DIR is set (server.py sets it for WEB_CONCURRENCY > 1)
+every worker writes a snapshot of its metrics there every
+METRICS_SHARE_INTERVAL seconds, and /metrics renders the sum of all
+snapshots. An exited worker's counts are folded into a single `retired.json`
+(by the worker itself when it stops, or by the next scrape when it died), so
+counters never go backwards when a worker is recycled and the directory
+doesn't grow with every recycle.
+"""
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-worker server there, so no one to race with
+    fcntl = None
+
+# Seconds; covers sub-millisecond cache hits up to the 60 s inference timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total: dict, values: dict):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0.0) + value
+
+    def render(self, values: Optional[dict] = None) -> list:
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    @staticmethod
+    def merge(total: dict, values: dict):
+        for labels, series in values.items():
+            current = total.get(labels)
+            total[labels] = list(series) if current is None else [a + b for a, b in zip(current, series)]
+
+    def render(self, snapshot: Optional[dict] = None) -> list:
+        snapshot = self.snapshot() if snapshot is None else snapshot
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        inf = 'le="+Inf"'
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, snapshots: Optional[list] = None) -> str:
+        """
+        This process's metrics, or the sum of `snapshots` (from snapshot()) when given
+        """
+        lines = []
+        total = None if snapshots is None else self.merge(snapshots)
+        for metric in self._metrics:
+            lines.extend(metric.render() if total is None else metric.render(total[metric.name]))
+        return "\n".join(lines) + "\n"
+
+    def merge(self, snapshots: list) -> dict:
+        """
+        One snapshot holding the sum of `snapshots`
+        """
+        total = {metric.name: {} for metric in self._metrics}
+        for metric in self._metrics:
+            for snapshot in snapshots:
+                metric.merge(total[metric.name], snapshot.get(metric.name, {}))
+        return total
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+
+def _encode(snapshot: dict) -> str:
+    # JSON has no tuple keys: each metric becomes a list of [labels, value] pairs
+    return json.dumps({name: [[list(labels), value] for labels, value in values.items()]
+                       for name, values in snapshot.items()})
+
+
+def _decode(text: str) -> dict:
+    return {name: {tuple(labels): value for labels, value in pairs} for name, pairs in json.loads(text).items()}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SnapshotSharer:
+    """
+    Writes this worker's metrics to `directory` every `interval` seconds so
+    any worker can render the totals
+    """
+
+    RETIRED = "retired.json"
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 1.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        # Unique per worker lifetime, so a recycled worker with a reused pid doesn't overwrite its predecessor
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="metrics-sharer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            with self._lock(fcntl.LOCK_EX if fcntl else None):
+                self._retire([self.registry.snapshot()], [self.path])
+        except OSError as e:
+            print(f"Could not fold metrics snapshot into the retired totals: {e}")
+            self.write()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self._write(self.path, self.registry.snapshot())
+        except OSError as e:
+            print(f"Could not write metrics snapshot: {e}")
+
+    @staticmethod
+    def _write(path: str, snapshot: dict):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(_encode(snapshot))
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _lock(self, operation):
+        """
+        Folding into retired.json takes it exclusively and scrapes share it, so
+        a scrape never counts a snapshot both in its own file and in the totals
+        """
+        if operation is None:
+            yield
+            return
+        with open(os.path.join(self.directory, "retired.lock"), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _retire(self, snapshots: list, paths: list):
+        retired_path = os.path.join(self.directory, self.RETIRED)
+        try:
+            with open(retired_path) as f:
+                snapshots = [_decode(f.read())] + snapshots
+        except FileNotFoundError:
+            pass
+        self._write(retired_path, self.registry.merge(snapshots))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _dead_workers(self) -> list:
+        dead = []
+        for path in glob.glob(os.path.join(self.directory, "*-*.json")):
+            pid = os.path.basename(path).split("-", 1)[0]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                dead.append(path)
+        return dead
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return _decode(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Skipping metrics snapshot {path}: {e}")
+            return None
+
+    def compact(self):
+        """
+        Fold the snapshots of workers that died without stopping into retired.json
+        """
+        if not self._dead_workers():
+            return
+        try:
+            with self._lock(fcntl.LOCK_EX if fcntl else None):
+                dead = self._dead_workers()
+                snapshots = [snapshot for snapshot in map(self._read, dead) if snapshot is not None]
+                self._retire(snapshots, dead)
+        except OSError as e:
+            print(f"Could not compact metrics snapshots: {e}")
+
+    def collect(self) -> list:
+        """
+        Every worker's latest snapshot plus the retired totals; this worker's is taken now.
+
+        Reads one file per live worker, so call it off the event loop.
+        """
+        self.compact()
+        snapshots = [self.registry.snapshot()]
+        with self._lock(fcntl.LOCK_SH if fcntl else None):
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                if path != self.path:
+                    snapshot = self._read(path)
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+        return snapshots
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "healthco_http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "healthco_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+stage_duration = registry.register(Histogram(
+    "healthco_stage_duration_seconds", "Time spent in each stage of request handling", ("stage",)))
+ai_responses = registry.register(Counter(
+    "healthco_ai_responses_total", "AI doctor answers by source (remote, cache, fallback)", ("source",)))
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage)
+
+
+def count_ai_response(source: str):
+    ai_responses.inc(source)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording status codes and latency per route template.
+
+    Labels use the matched route path (`/users/{user_id}`), not the raw URL, so
+    the number of series stays bounded. For streaming responses the latency is
+    time to the end of the stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_duration.observe(time.perf_counter() - start, method, path)
+            http_requests.inc(method, path, str(status["code"]))
+
+
+_sharer: Optional[SnapshotSharer] = None
+
+
+def start_sharing() -> Optional[SnapshotSharer]:
+    """
+    Start publishing this worker's metrics when METRICS_MULTIPROC_DIR is set
+    """
+    global _sharer
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    if directory and _sharer is None:
+        _sharer = SnapshotSharer(registry, directory, float(os.getenv("METRICS_SHARE_INTERVAL", "1")))
+        _sharer.start()
+    return _sharer
+
+
+def stop_sharing():
+    global _sharer
+    if _sharer is not None:
+        _sharer.stop()
+        _sharer = None
+
+
+def render_latest() -> str:
+    if _sharer is not None:
+        return registry.render(_sharer.collect())
+    return registry.render()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
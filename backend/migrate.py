@@ -0,0 +1,55 @@
+"""
+Explicit schema migration step.
+
+Run once per deploy, before starting the server:
+
+    python -m backend.migrate
+"""
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .database import init_engine
+from .models import Base
+
+
+def add_missing_columns(engine: Engine, table, inspector):
+    """
+    ALTER TABLE ... ADD COLUMN for nullable columns added to the model since the table was created
+    """
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable:
+            print(f"Cannot add NOT NULL column {table.name}.{column.name} automatically, skipping")
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                              f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"))
+
+
+def create_schema(engine: Engine):
+    """
+    Create missing tables, then any columns and indexes added to tables that already exist
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        add_missing_columns(engine, table, inspector)
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
+
+def main():
+    load_dotenv()
+    engine = init_engine()
+    create_schema(engine)
+    print(f"Schema is up to date ({engine.url.render_as_string(hide_password=True)})")
+
+
+if __name__ == "__main__":
+    main()
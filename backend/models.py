@@ -1,9 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 Base = declarative_base()
 
@@ -28,7 +28,7 @@ class Conversation(Base):
     __tablename__ = "conversations"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     title = Column(String, default="Health Consultation")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -46,11 +46,30 @@ class Message(Base):
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    category = Column(String)  # symptom category of a user message, for the analytics rollups
+    location = Column(String)  # the location a user message was counted under in those rollups
     
     # Relationships
     user = relationship("User", back_populates="messages")
     conversation = relationship("Conversation", back_populates="messages")
 
+    # Keyset pagination over a conversation's history seeks on this index
+    __table_args__ = (
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp"),
+    )
+
+class SymptomDailyCount(Base):
+    """
+    User messages per day, location and symptom category, kept up to date as
+    messages are written so the analytics endpoint never scans `messages`
+    """
+    __tablename__ = "symptom_daily_counts"
+
+    day = Column(Date, primary_key=True)
+    location = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
 # Pydantic Models for API
 class UserCreate(BaseModel):
     username: str
@@ -81,9 +100,26 @@ class LoginResponse(BaseModel):
 class ChatRequest(BaseModel):
     user_id: int
     message: str
+    conversation_id: Optional[int] = None
+    use_cache: bool = True
 
 class ChatResponse(BaseModel):
     response: str
+    conversation_id: Optional[int] = None
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest]
+
+class ChatBatchResult(BaseModel):
+    index: int
+    status_code: int = 200
+    response: Optional[str] = None
+    conversation_id: Optional[int] = None
+    error: Optional[str] = None
+    retry_after: Optional[int] = None
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchResult]
 
 class MessageResponse(BaseModel):
     id: int
@@ -92,4 +128,9 @@ class MessageResponse(BaseModel):
     timestamp: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]
+    next_cursor: Optional[str] = None
+    newer_cursor: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ProfileRecord:
+    """
+    The few user fields the chat path needs, without an ORM instance behind them
+    """
+    __slots__ = ("id", "full_name", "age", "location")
+
+    def __init__(self, id: int, full_name: Optional[str], age: Optional[int], location: Optional[str]):
+        self.id = id
+        self.full_name = full_name
+        self.age = age
+        self.location = location
+
+    def to_context(self) -> dict:
+        return {
+            "full_name": self.full_name,
+            "age": self.age,
+            "location": self.location
+        }
+
+
+class InvalidationLog:
+    """
+    Append-only SQLite log of changed user ids, shared by every worker on the host
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS profile_invalidations "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM profile_invalidations").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def publish(self, user_id: int):
+        conn = self._connect()
+        conn.execute("INSERT INTO profile_invalidations (user_id, created_at) VALUES (?, ?)", (user_id, time.time()))
+        # Entries older than any cache TTL are no longer useful
+        conn.execute("DELETE FROM profile_invalidations WHERE created_at < ?", (time.time() - 86400,))
+
+    def poll(self) -> list:
+        rows = self._connect().execute(
+            "SELECT seq, user_id FROM profile_invalidations WHERE seq > ? ORDER BY seq", (self.last_seq,)
+        ).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+        return [user_id for _, user_id in rows]
+
+
+class ProfileCache:
+    """
+    Bounded LRU + TTL cache of ProfileRecord by user id.
+
+    Writes must call `invalidate()`. With an InvalidationLog configured the
+    invalidation is also published to the other workers, whose polling thread
+    (see `start()`) picks it up at most `poll_interval` seconds later; the TTL
+    bounds staleness otherwise. Lookups never touch the log.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 log: Optional[InvalidationLog] = None, poll_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.log = log
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict()  # user_id -> (expires_at, ProfileRecord)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "ProfileCache":
+        path = os.getenv("PROFILE_CACHE_INVALIDATION_PATH")
+        return cls(
+            max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000")),
+            ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+            log=InvalidationLog(path) if path else None,
+            poll_interval=float(os.getenv("PROFILE_CACHE_POLL_INTERVAL", "1")),
+        )
+
+    def start(self):
+        if self.log is None or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="profile-invalidations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.poll_interval):
+            self.apply_remote_invalidations()
+
+    def apply_remote_invalidations(self):
+        """
+        Drop the entries other workers have invalidated since the last poll
+        """
+        if self.log is None:
+            return
+        try:
+            user_ids = self.log.poll()
+        except sqlite3.Error as e:
+            print(f"Profile cache invalidation poll failed: {e}")
+            return
+        if user_ids:
+            with self._lock:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
+
+    def get(self, user_id: int) -> Optional[ProfileRecord]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, record: ProfileRecord):
+        with self._lock:
+            self._entries[record.id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(record.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+        if self.log is not None:
+            try:
+                self.log.publish(user_id)
+            except sqlite3.Error as e:
+                print(f"Profile cache invalidation publish failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache: Optional[ProfileCache] = None
+
+
+def get_profile_cache() -> ProfileCache:
+    global _cache
+    if _cache is None:
+        _cache = ProfileCache.from_env()
+    return _cache
+
+
+def start_invalidation_polling():
+    """
+    Follow other workers' profile invalidations when PROFILE_CACHE_INVALIDATION_PATH is set
+    """
+    get_profile_cache().start()
+
+
+def stop_invalidation_polling():
+    if _cache is not None:
+        _cache.stop()
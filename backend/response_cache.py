@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = re.compile(r"^[\W_]+|[\W_]+$")
+
+# Bumped when what a cached answer may contain changes, so older entries are never served
+KEY_VERSION = "2"
+
+
+def normalize_message(message: str) -> str:
+    message = _WHITESPACE.sub(" ", message.lower()).strip()
+    return _EDGE_PUNCTUATION.sub("", message)
+
+
+def age_band(age: Optional[int]) -> str:
+    if age is None:
+        return "unknown"
+    if age < 5:
+        return "0-4"
+    if age < 13:
+        return "5-12"
+    if age < 18:
+        return "13-17"
+    if age < 40:
+        return "18-39"
+    if age < 65:
+        return "40-64"
+    return "65+"
+
+
+def make_key(user_message: str, user_context: Optional[dict] = None) -> str:
+    """
+    Cache key from the normalized message plus the context that changes the prompt
+    """
+    user_context = user_context or {}
+    location = (user_context.get("location") or "malawi").strip().lower()
+    raw = "\x1f".join([KEY_VERSION, normalize_message(user_message), age_band(user_context.get("age")), location])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite-backed cache file shared by every worker process on the host.
+
+    Calls block (up to the 1 s busy timeout while another worker writes), so
+    async code goes through ResponseCache.get_async/set_async, which run them
+    in a thread. Connections are per thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # prune() deletes by expiry and keeps the newest entries; without this it scans and sorts the table
+        conn.execute("CREATE INDEX IF NOT EXISTS response_cache_expires_at ON response_cache (expires_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, now: float) -> Optional[tuple]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune(time.time())
+
+    def prune(self, now: float):
+        conn = self._connect()
+        conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+
+
+class ResponseCache:
+    """
+    Bounded LRU + TTL cache for AI answers.
+
+    Memory use is capped both by entry count and by the total size of the
+    cached answers. An optional DiskCache lets several uvicorn workers reuse
+    each other's entries; it is consulted only on a memory miss.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024,
+                 ttl: float = 3600.0, disk: Optional[DiskCache] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = disk
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        path = os.getenv("AI_CACHE_PATH")
+        disk = DiskCache(path, int(os.getenv("AI_CACHE_DISK_MAX_ENTRIES", "10000"))) if path else None
+        return cls(
+            max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("AI_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+            ttl=float(os.getenv("AI_CACHE_TTL", "3600")),
+            disk=disk,
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._disk_result(key, self._disk_get(key, now) if self.disk is not None else None)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """
+        get() for the event loop: a memory miss reads the disk cache in a thread
+        """
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        row = await asyncio.to_thread(self._disk_get, key, now) if self.disk is not None else None
+        return self._disk_result(key, row)
+
+    def set(self, key: str, value: str):
+        expires_at = self._memory_set(key, value)
+        if self.disk is not None:
+            self._disk_set(key, value, expires_at)
+
+    async def set_async(self, key: str, value: str):
+        expires_at = self._memory_set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+        return None
+
+    def _memory_set(self, key: str, value: str) -> float:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        return expires_at
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        try:
+            return self.disk.get(key, now)
+        except sqlite3.Error as e:
+            print(f"Response cache disk error: {e}")
+            return None
+
+    def _disk_set(self, key: str, value: str, expires_at: float):
+        try:
+            self.disk.set(key, value, expires_at)
+        except sqlite3.Error as e:
+            print(f"Response cache disk error: {e}")
+
+    def _disk_result(self, key: str, row: Optional[tuple]) -> Optional[str]:
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, row[0], row[1])
+        return row[0]
+
+    def _store(self, key: str, value: str, expires_at: float):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Shared process-wide cache, or None when AI_CACHE_ENABLED=0
+    """
+    global _cache
+    if os.getenv("AI_CACHE_ENABLED", "1") == "0":
+        return None
+    if _cache is None:
+        _cache = ResponseCache.from_env()
+    return _cache
@@ -0,0 +1,394 @@
+"""
+Retrieval-based offline doctor over the symptom knowledge base.
+
+Entries are vectorized with TF-IDF over hashed word, word-bigram and
+character n-gram features, so misspellings and word forms ("vomited",
+"vomiting") still match. The index is stored feature-major (one row of
+entry weights per hashed feature), which makes scoring a query a single
+sparse matrix-vector product over the rows the query actually touches.
+
+Build a persistent index once and let every worker memory-map it:
+
+    python -m backend.retrieval build --out /var/cache/healthco/retrieval
+    python -m backend.retrieval query "I keep vomiting and feel dizzy"
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(__file__), "data", "knowledge_base.json")
+
+N_FEATURES = 1 << 20
+CHAR_NGRAMS = (3, 4, 5)
+INDEX_VERSION = 1
+# Queries touching more postings than this are scored by scipy instead
+SMALL_QUERY_POSTINGS = 4096
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+# Function words carry no symptom information but would otherwise match every entry
+STOP_WORDS = frozenset(
+    "a an and are am as at be been but by can could did do does doing for from had has have having he her "
+    "him his how i i'm i've if in is it it's its me my of on or our please she should so some than that "
+    "the their them then there these they this to too was we were what when where which while who why "
+    "will with would you your yours doctor since yesterday today been really very much also just".split()
+)
+
+
+# Patients younger than this get child entries; older ones get adult entries
+ADULT_AGE = 12
+CHILD_WORDS = frozenset(
+    "child children baby babies infant infants toddler kid kids newborn son daughter boy girl".split()
+)
+
+
+class KnowledgeEntry:
+    __slots__ = ("id", "category", "title", "symptoms", "advice", "urgent", "audience")
+
+    def __init__(self, id: str, category: str, title: str, symptoms: str, advice: str, urgent: bool = False,
+                 audience: Optional[str] = None):
+        self.id = id
+        self.category = category
+        self.title = title
+        self.symptoms = symptoms
+        self.advice = advice
+        self.urgent = urgent
+        self.audience = audience  # "child", "adult" or None for anyone
+
+    def document(self) -> str:
+        return f"{self.title} {self.symptoms}"
+
+
+def load_entries(paths: List[str]) -> List[KnowledgeEntry]:
+    """
+    Read entries from JSON files ({"entries": [...]}) or JSON Lines files.
+    A later entry with the same id replaces an earlier one.
+    """
+    entries = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)["entries"]
+        for record in records:
+            entries[record["id"]] = KnowledgeEntry(
+                record["id"], record.get("category", "general"), record["title"],
+                record.get("symptoms", ""), record["advice"], bool(record.get("urgent", False)),
+                record.get("audience"),
+            )
+    return list(entries.values())
+
+
+def knowledge_base_paths() -> List[str]:
+    extra = os.getenv("KNOWLEDGE_BASE_PATH", "")
+    return [KNOWLEDGE_BASE_PATH] + [path for path in extra.split(os.pathsep) if path]
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in _TOKEN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def _word_grams(word: str) -> List[str]:
+    padded = f" {word} "
+    grams = [f"w:{word}"]
+    for n in CHAR_NGRAMS:
+        grams.extend(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return grams
+
+
+def features(text: str) -> List[str]:
+    words = _words(text)
+    grams = [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        grams.extend(_word_grams(word))
+    return grams
+
+
+def _hash(gram: str) -> int:
+    # crc32 is stable across processes, unlike hash(), so a saved index stays valid
+    return zlib.crc32(gram.encode()) % N_FEATURES
+
+
+def hash_features(grams: List[str]):
+    import numpy as np
+
+    return np.fromiter(map(_hash, grams), dtype=np.int32, count=len(grams))
+
+
+@lru_cache(maxsize=50000)
+def _word_hashes(word: str) -> tuple:
+    return tuple(map(_hash, _word_grams(word)))
+
+
+def query_features(text: str):
+    """
+    hash_features(features(text)), with each word's n-grams hashed once per process
+    """
+    import numpy as np
+
+    words = _words(text)
+    hashed = [_hash(f"b:{a} {b}") for a, b in zip(words, words[1:])]
+    for word in words:
+        hashed.extend(_word_hashes(word))
+    return np.array(hashed, dtype=np.int32)
+
+
+def fingerprint(entries: List[KnowledgeEntry]) -> str:
+    digest = hashlib.sha256(f"{INDEX_VERSION}|{N_FEATURES}|{CHAR_NGRAMS}".encode())
+    for entry in entries:
+        digest.update(f"\x00{entry.id}\x00{entry.document()}".encode())
+    return digest.hexdigest()
+
+
+class RetrievalIndex:
+    """
+    Feature-major TF-IDF matrix (N_FEATURES x entries) plus the IDF vector
+    """
+
+    def __init__(self, postings, idf):
+        self.postings = postings
+        self.idf = idf
+
+    @classmethod
+    def build(cls, entries: List[KnowledgeEntry]) -> "RetrievalIndex":
+        import numpy as np
+        from scipy import sparse
+
+        rows, cols, values = [], [], []
+        for column, entry in enumerate(entries):
+            # Binary term weights: listing "headache" in five phrasings should not make an entry win
+            hashed = np.unique(hash_features(features(entry.document())))
+            rows.append(hashed)
+            cols.append(np.full(len(hashed), column, dtype=np.int32))
+            values.append(np.ones(len(hashed)))
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32)
+        values = np.concatenate(values) if values else np.zeros(0)
+
+        document_frequency = np.bincount(rows, minlength=N_FEATURES)
+        idf = (np.log((1 + len(entries)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+        values = values * idf[rows]
+
+        # L2-normalize each entry so a dot product is a cosine similarity
+        norms = np.sqrt(np.bincount(cols, weights=values ** 2, minlength=len(entries)))
+        values = (values / np.maximum(norms[cols], 1e-12)).astype(np.float32)
+
+        postings = sparse.csr_matrix((values, (rows, cols)), shape=(N_FEATURES, len(entries)), dtype=np.float32)
+        return cls(postings, idf)
+
+    def save(self, directory: str, fingerprint_value: str):
+        import numpy as np
+
+        os.makedirs(directory, exist_ok=True)
+        for name, array in (("data", self.postings.data), ("indices", self.postings.indices),
+                            ("indptr", self.postings.indptr), ("idf", self.idf)):
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"fingerprint": fingerprint_value, "entries": self.postings.shape[1]}, f)
+
+    @classmethod
+    def load(cls, directory: str, fingerprint_value: str) -> Optional["RetrievalIndex"]:
+        """
+        Memory-map a saved index; None when it is missing or was built from different entries
+        """
+        import numpy as np
+        from scipy import sparse
+
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("fingerprint") != fingerprint_value:
+            return None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ("data", "indices", "indptr", "idf")}
+        postings = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                     shape=(N_FEATURES, meta["entries"]), copy=False)
+        return cls(postings, arrays["idf"])
+
+    def score(self, text: str):
+        import numpy as np
+
+        hashed = np.unique(query_features(text))
+        weights = self.idf[hashed].astype(np.float64)
+        norm = np.sqrt(np.dot(weights, weights))
+        if norm == 0:
+            return np.zeros(self.postings.shape[1], dtype=np.float32)
+        weights = weights / norm
+        # Only the query's feature rows take part: (q x entries)^T @ (q,)
+        postings = self.postings
+        starts, ends = postings.indptr[hashed], postings.indptr[hashed + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total > SMALL_QUERY_POSTINGS:
+            return postings[hashed].T.dot(weights.astype(np.float32))
+        # For a small knowledge base, scipy's fancy-indexing overhead is most of
+        # the cost, so gather the rows straight from the CSR arrays instead
+        present = lengths > 0
+        starts, lengths, weights = starts[present], lengths[present], weights[present]
+        if total == 0:
+            return np.zeros(postings.shape[1], dtype=np.float32)
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(total) - np.repeat(offsets - starts, lengths)
+        contributions = postings.data[positions] * np.repeat(weights, lengths)
+        return np.bincount(postings.indices[positions], weights=contributions,
+                           minlength=postings.shape[1]).astype(np.float32)
+
+
+class RetrievalDoctor:
+    """
+    Answers a message from the top-k knowledge base entries.
+
+    The best entry leads; up to `top_k - 1` entries from other categories that
+    score at least `related_ratio` of the best are added, so "fever and a
+    cough" covers both. Entries are ordered by score, except that an urgent
+    entry scoring at least `urgent_ratio` of the best leads; an urgent entry
+    is never dropped for a milder one of the same category. With the patient's age
+    known, child entries are skipped for adults (unless the message is about
+    a child) and adult entries for children.
+    """
+
+    def __init__(self, entries: List[KnowledgeEntry], index: RetrievalIndex, top_k: int = 3,
+                 min_score: float = 0.2, related_ratio: float = 0.6, urgent_ratio: float = 0.9):
+        import numpy as np
+
+        self.entries = entries
+        self.index = index
+        self.top_k = top_k
+        self.min_score = min_score
+        self.related_ratio = related_ratio
+        self.urgent_ratio = urgent_ratio
+        self._child_only = np.array([entry.audience == "child" for entry in entries], dtype=bool)
+        self._adult_only = np.array([entry.audience == "adult" for entry in entries], dtype=bool)
+
+    def _excluded(self, message: str, age: Optional[int]):
+        if age is None:
+            return None
+        if age < ADULT_AGE:
+            return self._adult_only
+        if CHILD_WORDS.isdisjoint(_TOKEN.findall(message.lower())):
+            return self._child_only
+        return None
+
+    def search(self, message: str, k: int = None, age: Optional[int] = None) -> List[Tuple[float, KnowledgeEntry]]:
+        import numpy as np
+
+        k = min(k or self.top_k, len(self.entries))
+        if k == 0:
+            return []
+        scores = self.index.score(message)
+        excluded = self._excluded(message, age)
+        if excluded is not None:
+            scores = np.where(excluded, 0.0, scores)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.entries[i]) for i in top if scores[i] > 0]
+
+    def answer(self, message: str, user_context: Optional[dict] = None) -> Optional[str]:
+        hits = self.search(message, age=_patient_age(user_context))
+        if not hits or hits[0][0] < self.min_score:
+            return None
+
+        best_score = hits[0][0]
+        related = [(score, entry) for score, entry in hits if score >= best_score * self.related_ratio]
+        # One entry per category: its urgent entry if it has one among the hits, else its best
+        by_category = {}
+        for score, entry in related:
+            kept = by_category.get(entry.category)
+            if kept is None or (entry.urgent and not kept[1].urgent):
+                by_category[entry.category] = (score, entry)
+        # Best match first; an urgent entry leads only when it scores nearly as well
+        chosen = sorted(by_category.values(), key=lambda hit: (
+            not (hit[1].urgent and hit[0] >= best_score * self.urgent_ratio), -hit[0]))
+        chosen = [entry for _, entry in chosen]
+
+        location = (user_context or {}).get("location") or "Malawi"
+        parts = [entry.advice for entry in chosen]
+        parts.append(f"If your symptoms get worse or you are worried, please visit your nearest health "
+                     f"facility in {location}. This advice does not replace an examination by a health worker.")
+        return "\n\n".join(parts).replace("{location}", location)
+
+
+def _patient_age(user_context: Optional[dict]) -> Optional[int]:
+    try:
+        return int((user_context or {}).get("age"))
+    except (TypeError, ValueError):
+        return None
+
+
+def build_doctor(paths: List[str] = None, index_dir: str = None, **kwargs) -> RetrievalDoctor:
+    """
+    Load the knowledge base and its index, memory-mapping `index_dir` when it
+    holds an index for the same entries and rebuilding (and saving) it otherwise
+    """
+    entries = load_entries(paths or knowledge_base_paths())
+    key = fingerprint(entries)
+    index = RetrievalIndex.load(index_dir, key) if index_dir else None
+    if index is None:
+        index = RetrievalIndex.build(entries)
+        if index_dir:
+            try:
+                index.save(index_dir, key)
+            except OSError as e:
+                print(f"Could not save retrieval index to {index_dir}: {e}")
+    return RetrievalDoctor(entries, index, **kwargs)
+
+
+_doctor: Optional[RetrievalDoctor] = None
+_unavailable = False
+
+
+def get_doctor() -> Optional[RetrievalDoctor]:
+    """
+    The shared retrieval doctor, or None when disabled or numpy/scipy are missing
+    """
+    global _doctor, _unavailable
+    if _doctor is not None or _unavailable:
+        return _doctor
+    if os.getenv("OFFLINE_RETRIEVAL_ENABLED", "1") == "0":
+        _unavailable = True
+        return None
+    try:
+        _doctor = build_doctor(
+            index_dir=os.getenv("RETRIEVAL_INDEX_DIR") or None,
+            top_k=int(os.getenv("RETRIEVAL_TOP_K", "3")),
+            min_score=float(os.getenv("RETRIEVAL_MIN_SCORE", "0.2")),
+        )
+    except ImportError as e:
+        print(f"Offline retrieval disabled, keyword rules only: {e}")
+        _unavailable = True
+    return _doctor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline retrieval index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="precompute the index so workers can memory-map it")
+    build.add_argument("--out", default=os.getenv("RETRIEVAL_INDEX_DIR"), required=not os.getenv("RETRIEVAL_INDEX_DIR"))
+    query = subparsers.add_parser("query", help="show the top entries for a message")
+    query.add_argument("message")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        entries = load_entries(knowledge_base_paths())
+        RetrievalIndex.build(entries).save(args.out, fingerprint(entries))
+        print(f"Indexed {len(entries)} entries into {args.out} in {time.perf_counter() - start:.2f}s")
+    else:
+        doctor = build_doctor(index_dir=os.getenv("RETRIEVAL_INDEX_DIR") or None)
+        for score, entry in doctor.search(args.message, args.k):
+            print(f"{score:.3f}  {entry.id:<24} {entry.title}")
+        print()
+        print(doctor.answer(args.message) or "(below RETRIEVAL_MIN_SCORE; keyword rules answer instead)")
+
+
+if __name__ == "__main__":
+    main()
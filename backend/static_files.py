@@ -0,0 +1,348 @@
+"""
+Build and serve the `public/` frontend.
+
+The build step content-hashes CSS and JS (`css/style.3f2a9c1b7e.css`),
+rewrites the HTML pages to reference the hashed names, and writes gzip and
+brotli versions of every file next to it, plus a manifest:
+
+    python -m backend.static_files build            # public/ -> build/public/
+    python -m backend.static_files report           # bytes per page load
+
+At runtime `StaticAssets` serves from the build (or straight from `public/`
+when no build exists): it picks the best precompressed variant for the
+client's Accept-Encoding, answers If-None-Match with 304, marks hashed files
+immutable, and uses the server's zero-copy file send when it offers one.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from typing import Optional
+
+import anyio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(ROOT, "public")
+BUILD_DIR = os.path.join(ROOT, "build", "public")
+MANIFEST = "manifest.json"
+
+HASHED_EXTENSIONS = (".css", ".js")
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".txt")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_ASSET_REFERENCE = re.compile(r'(?P<attr>href|src)="(?P<path>/[^"?#]+\.(?:css|js))"')
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _compress(data: bytes) -> dict:
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants["br"] = brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    # A variant that isn't smaller is never worth sending
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(source: str = SOURCE_DIR, out: str = BUILD_DIR) -> dict:
+    """
+    Write hashed, precompressed assets and the manifest to `out`; returns the manifest
+    """
+    sources = {}
+    for directory, _, files in os.walk(source):
+        for name in files:
+            path = os.path.join(directory, name)
+            url = "/" + os.path.relpath(path, source).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                sources[url] = f.read()
+
+    # Hash CSS/JS first so the HTML can be rewritten to point at the hashed names
+    renamed = {}
+    for url, data in sources.items():
+        if url.endswith(HASHED_EXTENSIONS):
+            stem, extension = os.path.splitext(url)
+            renamed[url] = f"{stem}.{_digest(data)[:10]}{extension}"
+
+    def rewrite(match):
+        return f'{match.group("attr")}="{renamed.get(match.group("path"), match.group("path"))}"'
+
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    files, aliases, pages = {}, {}, {}
+    for url, data in sources.items():
+        if url.endswith(".html"):
+            html = data.decode("utf-8")
+            pages[url] = sorted({renamed[match.group("path")] for match in _ASSET_REFERENCE.finditer(html)
+                                 if match.group("path") in renamed})
+            data = _ASSET_REFERENCE.sub(rewrite, html).encode("utf-8")
+        served = renamed.get(url, url)
+        if served != url:
+            aliases[url] = served
+
+        target = os.path.join(out, served.lstrip("/"))
+        _write(target, data)
+        entry = {"etag": _digest(data)[:16], "size": len(data), "immutable": served != url, "encodings": {}}
+        if url.endswith(COMPRESSIBLE_EXTENSIONS):
+            for encoding, body in _compress(data).items():
+                _write(target + (".br" if encoding == "br" else ".gz"), body)
+                entry["encodings"][encoding] = len(body)
+        files[served] = entry
+
+    manifest = {"files": files, "aliases": aliases, "pages": pages}
+    with open(os.path.join(out, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def size_report(manifest: dict) -> list:
+    """
+    Bytes on the wire for a first load of each page (the HTML plus its CSS/JS)
+    uncompressed, with gzip and with brotli
+    """
+    rows = []
+    for page, assets in sorted(manifest["pages"].items()):
+        raw = gz = br = 0
+        for url in [page] + assets:
+            entry = manifest["files"][url]
+            raw += entry["size"]
+            gz += entry["encodings"].get("gzip", entry["size"])
+            br += entry["encodings"].get("br", entry["encodings"].get("gzip", entry["size"]))
+        rows.append({"page": page, "raw": raw, "gzip": gz, "br": br, "saved": raw - br})
+    return rows
+
+
+def _scan(directory: str) -> dict:
+    """
+    Manifest for an unbuilt directory: no hashing or precompression, only ETags
+    """
+    files = {}
+    for path_dir, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(path_dir, name)
+            stat = os.stat(path)
+            url = "/" + os.path.relpath(path, directory).replace(os.sep, "/")
+            files[url] = {"etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}", "size": stat.st_size,
+                          "immutable": False, "encodings": {}}
+    return {"files": files, "aliases": {}, "pages": {}}
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        token, *params = part.split(";")
+        try:
+            refused = any(float(param.strip()[2:] or 0) == 0 for param in params if param.strip().startswith("q="))
+        except ValueError:
+            # Malformed q-value: skip the coding rather than guess; identity is always available
+            continue
+        if not refused:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    __slots__ = ("path", "content_type", "etag", "cache_control", "variants")
+
+    def __init__(self, path: str, content_type: str, etag: str, cache_control: str, variants: dict):
+        self.path = path
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = cache_control
+        self.variants = variants  # encoding ("identity", "br", "gzip") -> (file path, size, body or None)
+
+
+class StaticAssets:
+    """
+    ASGI app serving a built (or plain) `public/` directory.
+
+    Everything is resolved at startup from the manifest, so a request is a
+    dict lookup. Bodies are sent with the server's zero-copy extension
+    (`http.response.zerocopysend` or `http.response.pathsend`) when it offers
+    one; otherwise files under `memory_limit` bytes are sent from memory and
+    larger ones are streamed in chunks.
+    """
+
+    def __init__(self, directory: str, memory_limit: int = 256 * 1024):
+        self.directory = directory
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            manifest = _scan(directory)
+
+        self.files = {}
+        for url, entry in manifest["files"].items():
+            if url == "/" + MANIFEST:
+                continue
+            path = os.path.join(directory, url.lstrip("/"))
+            variants = {"identity": path}
+            for encoding in entry["encodings"]:
+                variants[encoding] = path + (".br" if encoding == "br" else ".gz")
+            content_type = mimetypes.guess_type(url)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type.endswith(("javascript", "json")):
+                content_type += "; charset=utf-8"
+            self.files[url] = StaticFile(
+                path,
+                content_type,
+                entry["etag"],
+                IMMUTABLE if entry["immutable"] else REVALIDATE,
+                {encoding: self._load(file_path, memory_limit) for encoding, file_path in variants.items()},
+            )
+        # Old unhashed names keep working, but must be revalidated
+        for alias, target in manifest["aliases"].items():
+            original = self.files[target]
+            self.files[alias] = StaticFile(original.path, original.content_type, original.etag,
+                                           REVALIDATE, original.variants)
+
+    @staticmethod
+    def _load(path: str, memory_limit: int) -> tuple:
+        size = os.path.getsize(path)
+        body = None
+        if size <= memory_limit:
+            with open(path, "rb") as f:
+                body = f.read()
+        return path, size, body
+
+    def _lookup(self, url: str) -> Optional[StaticFile]:
+        if url.endswith("/"):
+            url += "index.html"
+        found = self.files.get(url)
+        if found is None and "." not in url.rsplit("/", 1)[-1]:
+            found = self.files.get(url + ".html")
+        return found
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        static_file = self._lookup(scope["path"])
+        if scope["method"] not in ("GET", "HEAD") or static_file is None:
+            status = 405 if static_file is not None else 404
+            await send({"type": "http.response.start", "status": status,
+                        "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+            await send({"type": "http.response.body", "body": b"Method Not Allowed" if status == 405 else b"Not Found"})
+            return
+
+        request_headers = dict(scope["headers"])
+        accepted = _accepted_encodings(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in static_file.variants), "identity")
+        path, size, body = static_file.variants[encoding]
+
+        # One ETag per representation, so caches never mix up compressed and plain bodies
+        etag = f'"{static_file.etag}"' if encoding == "identity" else f'"{static_file.etag}-{encoding}"'
+        headers = [
+            (b"etag", etag.encode()),
+            (b"cache-control", static_file.cache_control.encode()),
+            (b"vary", b"accept-encoding"),
+        ]
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers.append((b"content-type", static_file.content_type.encode()))
+        headers.append((b"content-length", str(size).encode()))
+        if encoding != "identity":
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._send_body(scope, send, path, size, body)
+
+    async def _send_body(self, scope, send, path: str, size: int, body: Optional[bytes]):
+        # Files are opened and read in a worker thread, as Starlette's FileResponse does
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            async with await anyio.open_file(path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f.wrapped.fileno(), "count": size})
+        elif "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": path})
+        elif body is not None:
+            await send({"type": "http.response.body", "body": body})
+        else:
+            async with await anyio.open_file(path, "rb") as f:
+                while chunk := await f.read(64 * 1024):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+
+def _newest_mtime(directory: str) -> float:
+    newest = 0.0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            newest = max(newest, os.path.getmtime(os.path.join(dirpath, filename)))
+    return newest
+
+
+def static_directory() -> Optional[str]:
+    """
+    STATIC_DIR, else the build output when it is up to date, else public/;
+    None when SERVE_STATIC=0
+    """
+    if os.getenv("SERVE_STATIC", "1") == "0":
+        return None
+    configured = os.getenv("STATIC_DIR")
+    if configured:
+        return configured
+    source = SOURCE_DIR if os.path.isdir(SOURCE_DIR) else None
+    manifest = os.path.join(BUILD_DIR, MANIFEST)
+    if not os.path.exists(manifest):
+        return source
+    if source and _newest_mtime(source) > os.path.getmtime(manifest):
+        # Someone edited public/ after the last build: serve the edit, not the stale copy
+        print(f"{SOURCE_DIR} is newer than {BUILD_DIR}; serving it unhashed and uncompressed. "
+              f"Run `python -m backend.static_files build` to rebuild.")
+        return source
+    return BUILD_DIR
+
+
+def print_report(rows: list):
+    print(f"{'page':<18}{'raw':>10}{'gzip':>10}{'brotli':>10}{'saved':>10}")
+    for row in rows:
+        print(f"{row['page']:<18}{row['raw']:>10}{row['gzip']:>10}{row['br']:>10}{row['saved']:>10}")
+    print("Repeat visits reuse the immutable CSS/JS and revalidate the page with a bodyless 304.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the precompressed frontend or report its sizes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="hash and precompress public/")
+    build_parser.add_argument("--source", default=SOURCE_DIR)
+    build_parser.add_argument("--out", default=BUILD_DIR)
+    report_parser = subparsers.add_parser("report", help="bytes per page load for an existing build")
+    report_parser.add_argument("--out", default=BUILD_DIR)
+    report_parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = build(args.source, args.out)
+        print(f"Built {len(manifest['files'])} files into {args.out}")
+        print_report(size_report(manifest))
+    else:
+        with open(os.path.join(args.out, MANIFEST)) as f:
+            rows = size_report(json.load(f))
+        print_report(rows)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+from typing import Optional
+
+RULES_PATH = os.path.join(os.path.dirname(__file__), "data", "symptom_rules.json")
+
+# Lower is served first
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+_PRIORITIES = {"urgent": PRIORITY_URGENT, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+
+
+class SymptomRule:
+    __slots__ = ("index", "category", "keywords", "response", "priority")
+
+    def __init__(self, index: int, category: str, keywords: list, response: str, priority: int = PRIORITY_NORMAL):
+        self.index = index
+        self.category = category
+        self.keywords = keywords
+        self.response = response
+        self.priority = priority
+
+
+class SymptomMatcher:
+    """
+    Matches a message against every symptom rule in a single regex pass.
+
+    All keywords are compiled into one word-boundary alternation (longest first,
+    so "chest pain" wins over "pain"). Each keyword hit adds its word count to
+    the score of every rule that lists it; the highest score wins and ties go to
+    the rule listed first in the table.
+
+    `priority()` reuses the same vocabulary to triage a message for admission
+    control: any keyword of an urgent rule (or of `urgent_keywords`) makes it
+    urgent, and messages that only hit low-priority rules (greetings, thanks)
+    wait behind everything else.
+    """
+
+    def __init__(self, rules: list, default: dict, urgent_keywords: list = ()):
+        self.rules = [
+            SymptomRule(i, rule["category"], rule["keywords"], rule["response"],
+                        _PRIORITIES[rule.get("priority", "normal")])
+            for i, rule in enumerate(rules)
+        ]
+        self.default = SymptomRule(len(self.rules), default["category"], [], default["response"])
+
+        self._keyword_rules = {}
+        for rule in self.rules:
+            for keyword in rule.keywords:
+                keyword = keyword.lower()
+                self._keyword_rules.setdefault(keyword, [])
+                if rule.index not in self._keyword_rules[keyword]:
+                    self._keyword_rules[keyword].append(rule.index)
+        self._keyword_weight = {k: len(k.split()) for k in self._keyword_rules}
+
+        alternation = "|".join(
+            re.escape(k) for k in sorted(self._keyword_rules, key=len, reverse=True)
+        )
+        self._pattern = re.compile(r"\b(?:" + alternation + r")\b")
+
+        urgent = {k.lower() for k in urgent_keywords}
+        for rule in self.rules:
+            if rule.priority == PRIORITY_URGENT:
+                urgent.update(k.lower() for k in rule.keywords)
+        self._urgent_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(k) for k in sorted(urgent, key=len, reverse=True)) + r")\b"
+        ) if urgent else None
+
+    def _scores(self, message: str) -> dict:
+        scores = {}
+        for hit in self._pattern.finditer(message.lower()):
+            keyword = hit.group(0)
+            weight = self._keyword_weight[keyword]
+            for index in self._keyword_rules[keyword]:
+                scores[index] = scores.get(index, 0) + weight
+        return scores
+
+    def match(self, message: str) -> SymptomRule:
+        scores = self._scores(message)
+        if not scores:
+            return self.default
+        best = min(scores, key=lambda index: (-scores[index], index))
+        return self.rules[best]
+
+    def classify(self, message: str) -> str:
+        return self.match(message).category
+
+    def priority(self, message: str) -> int:
+        if self._urgent_pattern is not None and self._urgent_pattern.search(message.lower()):
+            return PRIORITY_URGENT
+        scores = self._scores(message)
+        if scores and all(self.rules[index].priority == PRIORITY_LOW for index in scores):
+            return PRIORITY_LOW
+        return PRIORITY_NORMAL
+
+    def match_urgent(self, message: str) -> SymptomRule:
+        """
+        The urgent rule that owns the message's urgent keywords (chest pain,
+        self-harm, ...), best score first. `urgent_keywords` belong to no
+        rule; a hit only on those gets the general emergency rule.
+        """
+        urgent = {index: score for index, score in self._scores(message).items()
+                  if self.rules[index].priority == PRIORITY_URGENT}
+        if urgent:
+            return self.rules[min(urgent, key=lambda index: (-urgent[index], index))]
+        fallback = [rule for rule in self.rules if rule.priority == PRIORITY_URGENT]
+        return next((rule for rule in fallback if rule.category == "emergency"), fallback[0] if fallback else self.default)
+
+    def respond(self, message: str, user_context: Optional[dict] = None, urgent: bool = False) -> str:
+        rule = self.match_urgent(message) if urgent else self.match(message)
+        location = (user_context or {}).get("location") or "Malawi"
+        return rule.response.replace("{location}", location)
+
+
+def load_matcher(path: str = RULES_PATH) -> SymptomMatcher:
+    with open(path, encoding="utf-8") as f:
+        table = json.load(f)
+    return SymptomMatcher(table["rules"], table["default"], table.get("urgent_keywords", []))
+
+
+# Compiled once at import; every fallback answer reuses it
+matcher = load_matcher()
@@ -0,0 +1,29 @@
+import math
+import os
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def web_concurrency() -> int:
+    """
+    Number of server worker processes; server.py exports the value it resolved
+    """
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def worker_share(total: float) -> float:
+    """
+    One worker's share of a capacity configured for the whole server.
+
+    Hashing processes, model slots and rate limits are enforced per worker
+    process, so each gets 1/WEB_CONCURRENCY of the total (at least 1, and 0
+    still means off).
+    """
+    if total <= 0:
+        return total
+    return max(1, math.ceil(total / web_concurrency())) if isinstance(total, int) else total / web_concurrency()
@@ -0,0 +1,144 @@
+"""
+Sync vs async database layer under concurrent load.
+
+Seeds a temporary SQLite database with users and conversation history, then
+starts the app (server.py) once with DB_ASYNC=0 and once with DB_ASYNC=1 and
+drives the same mix of profile reads, history pages, logins and chat messages
+from --users concurrent clients. Reports throughput and latency per endpoint
+for both modes.
+
+Usage: python benchmarks/bench_async_db.py [--users 200] [--duration 10] [--json results.json]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import httpx
+
+from common import ROOT, print_table, summarize_latencies, write_results
+from load_test import Recorder, free_port, wait_until_up
+
+from backend.database import create_db_engine
+from backend.migrate import create_schema
+from backend.models import Conversation, Message, User
+
+PASSWORD = "bench-password"
+
+
+def seed(url: str, users: int, messages_per_user: int, rounds: int):
+    engine = create_db_engine(url)
+    create_schema(engine)
+    hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+    start = datetime.utcnow() - timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i + 1, "username": f"bench{i}", "hashed_password": hashed, "full_name": f"Bench {i}",
+             "age": 20 + i % 50, "location": "Lilongwe"} for i in range(users)
+        ])
+        conn.execute(Conversation.__table__.insert(), [
+            {"id": i + 1, "user_id": i + 1, "title": "Benchmark"} for i in range(users)
+        ])
+        conn.execute(Message.__table__.insert(), [
+            {"conversation_id": i + 1, "user_id": i + 1, "role": "user" if j % 2 == 0 else "assistant",
+             "content": f"message {j}", "timestamp": start + timedelta(seconds=j)}
+            for i in range(users) for j in range(messages_per_user)
+        ])
+    engine.dispose()
+
+
+async def run_mix(base_url: str, users: int, duration: float) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def user_loop(user_id: int):
+            rng = random.Random(user_id)
+            while time.perf_counter() < deadline:
+                roll = rng.random()
+                if roll < 0.4:
+                    await recorder.call(client, "profile", "GET", f"/users/{user_id}")
+                elif roll < 0.8:
+                    await recorder.call(client, "history", "GET", f"/conversations/{user_id}/messages",
+                                        params={"user_id": user_id, "limit": 20})
+                elif roll < 0.9:
+                    await recorder.call(client, "login", "POST", "/users/login",
+                                        json={"username": f"bench{user_id - 1}", "password": PASSWORD})
+                else:
+                    await recorder.call(client, "chat", "POST", "/chat/message",
+                                        json={"user_id": user_id, "message": "I have a headache",
+                                              "conversation_id": user_id})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user_loop(i + 1) for i in range(users)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        endpoint: summarize_latencies(recorder.latencies.get(endpoint, []), elapsed, recorder.errors.get(endpoint, 0))
+        for endpoint in ("profile", "history", "login", "chat")
+    }
+
+
+def run_mode(db_url: str, async_mode: bool, users: int, duration: float, rounds: int) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=db_url,
+        DB_ASYNC="1" if async_mode else "0",
+        BCRYPT_ROUNDS=str(rounds),
+        PORT=str(port),
+        WEB_CONCURRENCY="1",
+        # Measure the database layer, not queueing or rate limiting
+        RATE_LIMIT_PER_MINUTE="0",
+        HASH_MAX_PENDING=str(users),
+    )
+    env.pop("HF_API_KEY", None)
+    process = subprocess.Popen([sys.executable, "server.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async def go():
+            await wait_until_up(f"http://127.0.0.1:{port}/health", process)
+            return await run_mix(f"http://127.0.0.1:{port}", users, duration)
+        return asyncio.run(go())
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--messages", type=int, default=60, help="history messages per seeded user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        seed(db_url, args.users, args.messages, args.bcrypt_rounds)
+        for async_mode in (False, True):
+            mode = "async" if async_mode else "sync"
+            for endpoint, row in run_mode(db_url, async_mode, args.users, args.duration, args.bcrypt_rounds).items():
+                results[f"{mode} {endpoint}"] = row
+
+    print_table(results)
+    for endpoint in ("profile", "history", "login", "chat"):
+        sync_rate, async_rate = results[f"sync {endpoint}"]["throughput"], results[f"async {endpoint}"]["throughput"]
+        if sync_rate:
+            print(f"{endpoint}: async throughput {async_rate / sync_rate:.2f}x sync")
+    if args.json:
+        parameters = {key: value for key, value in vars(args).items() if key != "json"}
+        write_results(args.json, "async_db", results, parameters)
+
+
+if __name__ == "__main__":
+    main()
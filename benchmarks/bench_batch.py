@@ -0,0 +1,135 @@
+"""
+One /chat/batch request versus looping over /chat/message, as an SMS or kiosk
+gateway would.
+
+Seeds a temporary SQLite database with users, starts the fake inference server
+(fake_hf.py) and the app (server.py), then delivers --messages messages from
+distinct users both ways: one POST at a time, and in batches of --batch-size.
+Each mode gets its own users, so both start with a cold profile cache.
+Reports wall time, HTTP round trips and messages per second.
+
+Usage: python benchmarks/bench_batch.py [--messages 200] [--batch-size 50] [--json results.json]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_async_db import seed
+from common import ROOT, print_table, summarize_latencies, write_results
+from load_test import CHAT_MESSAGES, free_port, wait_until_up
+
+
+async def deliver_singly(client: httpx.AsyncClient, user_ids: list) -> tuple:
+    latencies, errors = [], 0
+    for i, user_id in enumerate(user_ids):
+        started = time.perf_counter()
+        response = await client.post("/chat/message", json={"user_id": user_id,
+                                                            "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors += 1
+    return latencies, errors, len(user_ids)
+
+
+async def deliver_batched(client: httpx.AsyncClient, user_ids: list, batch_size: int) -> tuple:
+    latencies, errors, round_trips = [], 0, 0
+    for offset in range(0, len(user_ids), batch_size):
+        items = [{"user_id": user_id, "message": CHAT_MESSAGES[(offset + i) % len(CHAT_MESSAGES)]}
+                 for i, user_id in enumerate(user_ids[offset:offset + batch_size])]
+        started = time.perf_counter()
+        response = await client.post("/chat/batch", json={"items": items})
+        round_trips += 1
+        if response.status_code != 200:
+            errors += len(items)
+            continue
+        elapsed = time.perf_counter() - started
+        for result in response.json()["results"]:
+            if result["status_code"] == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+    return latencies, errors, round_trips
+
+
+async def run(base_url: str, messages: int, batch_size: int) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        for mode in ("single", "batch"):
+            user_ids = list(range(1, messages + 1)) if mode == "single" else list(range(messages + 1, 2 * messages + 1))
+            start = time.perf_counter()
+            if mode == "single":
+                latencies, errors, round_trips = await deliver_singly(client, user_ids)
+            else:
+                latencies, errors, round_trips = await deliver_batched(client, user_ids, batch_size)
+            elapsed = time.perf_counter() - start
+            row = summarize_latencies(latencies, elapsed, errors)
+            row["round_trips"] = round_trips
+            row["wall_s"] = round(elapsed, 3)
+            results[f"chat {mode}"] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="messages delivered per mode")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="CHAT_BATCH_CONCURRENCY for the app")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake inference latency")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    fake_port, app_port = free_port(), free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'batch.db')}"
+        seed(db_url, 2 * args.messages, 1, 4)
+        env = dict(
+            os.environ,
+            DATABASE_URL=db_url,
+            HF_API_KEY="bench-batch",
+            HF_API_URL=f"http://127.0.0.1:{fake_port}/models/medalpaca/medalpaca-7b",
+            AI_CACHE_ENABLED="0",
+            RATE_LIMIT_PER_MINUTE="0",
+            CHAT_BATCH_MAX_ITEMS=str(args.batch_size),
+            CHAT_BATCH_CONCURRENCY=str(args.concurrency),
+            PORT=str(app_port),
+            WEB_CONCURRENCY="1",
+        )
+        try:
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "benchmarks", "fake_hf.py"), "--port", str(fake_port),
+                 "--latency-ms", str(args.latency_ms), "--jitter-ms", "0"],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+            processes.append(subprocess.Popen([sys.executable, "server.py"], cwd=ROOT, env=env,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+            async def go():
+                await wait_until_up(f"http://127.0.0.1:{fake_port}/stats", processes[0])
+                await wait_until_up(f"http://127.0.0.1:{app_port}/health", processes[1])
+                return await run(f"http://127.0.0.1:{app_port}", args.messages, args.batch_size)
+
+            results = asyncio.run(go())
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+
+    print_table(results)
+    single, batch = results["chat single"], results["chat batch"]
+    print(f"round trips: {single['round_trips']} -> {batch['round_trips']}; "
+          f"wall time: {single['wall_s']:.1f}s -> {batch['wall_s']:.1f}s")
+    if args.json:
+        parameters = {key: value for key, value in vars(args).items() if key != "json"}
+        write_results(args.json, "batch", results, parameters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark bcrypt cost factors to pick BCRYPT_ROUNDS.
+
+Prints the time per hash for each cost factor and recommends the highest one
+that stays within the target latency. Logins per second per core is roughly
+1 / (time per hash).
+
+Usage: python benchmarks/bench_bcrypt.py [--target-ms 250] [--min-rounds 10] [--max-rounds 14] [--json results.json]
+"""
+import argparse
+import time
+
+from common import summarize_latencies, write_results
+
+from backend.hashing import _check, _hash
+from backend.workers import available_cores
+
+
+def measure(rounds: int, samples: int) -> dict:
+    password = b"correct horse battery staple"
+    hashed = _hash(password, rounds)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(samples):
+        t = time.perf_counter()
+        _check(password, hashed)
+        latencies.append(time.perf_counter() - t)
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    recommended = args.min_rounds
+    results = {}
+    print(f"{'rounds':>6} {'ms/hash':>10} {'logins/s/core':>14} {'logins/s (' + str(cores) + ' cores)':>20}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        results[f"bcrypt_rounds_{rounds}"] = measure(rounds, args.samples)
+        seconds = results[f"bcrypt_rounds_{rounds}"]["mean_ms"] / 1000
+        print(f"{rounds:>6} {seconds * 1000:>10.1f} {1 / seconds:>14.1f} {cores / seconds:>20.1f}")
+        if seconds * 1000 <= args.target_ms:
+            recommended = rounds
+        else:
+            break
+    print(f"\nRecommended BCRYPT_ROUNDS={recommended} (target {args.target_ms:.0f} ms per hash)")
+    if args.json:
+        write_results(args.json, "bcrypt", results, {"target_ms": args.target_ms, "recommended_rounds": recommended})
+
+
+if __name__ == "__main__":
+    main()
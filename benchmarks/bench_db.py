@@ -0,0 +1,108 @@
+"""
+Concurrent read/write benchmark: default SQLAlchemy engine vs backend.database.
+
+Reader threads page through a conversation while writer threads insert
+messages, the way chat traffic and history reads mix in production. Runs
+against a temporary SQLite file unless --url is given.
+
+Usage: python benchmarks/bench_db.py [--readers 8] [--writers 2] [--seconds 5] [--url postgresql://...]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import create_db_engine
+from backend.models import Base, Conversation, Message, User
+
+
+def seed(engine):
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user = User(username="bench", hashed_password="x")
+        db.add(user)
+        db.flush()
+        conversation = Conversation(user_id=user.id)
+        db.add(conversation)
+        db.flush()
+        db.execute(insert(Message), [
+            {"conversation_id": conversation.id, "user_id": user.id, "role": "user",
+             "content": f"message {i}", "timestamp": datetime.utcnow()}
+            for i in range(2000)
+        ])
+        db.commit()
+        return user.id, conversation.id
+
+
+def run(engine, readers: int, writers: int, seconds: float) -> dict:
+    user_id, conversation_id = seed(engine)
+    Session = sessionmaker(bind=engine)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader():
+        while time.perf_counter() < deadline:
+            try:
+                with Session() as db:
+                    db.execute(
+                        select(Message).where(Message.conversation_id == conversation_id)
+                        .order_by(Message.timestamp.desc()).limit(50)
+                    ).all()
+                with lock:
+                    counts["reads"] += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+
+    def writer():
+        while time.perf_counter() < deadline:
+            try:
+                with Session() as db:
+                    db.add(Message(conversation_id=conversation_id, user_id=user_id, role="user", content="hi"))
+                    db.commit()
+                with lock:
+                    counts["writes"] += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--url", help="database URL (tables are created; use a scratch database)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, factory in (("default", create_engine), ("tuned", create_db_engine)):
+            url = args.url or f"sqlite:///{os.path.join(tmp, label + '.db')}"
+            if args.url:
+                Base.metadata.drop_all(bind=create_engine(url))
+            result = run(factory(url), args.readers, args.writers, args.seconds)
+            print(f"{label:>8}: {result['reads']:>9.0f} reads/s {result['writes']:>8.0f} writes/s "
+                  f"{result['errors']:>6.1f} errors/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark for the offline fallback doctor.
+
+"fallback_response" times backend.ai_doctor.get_fallback_response, the path
+chat takes during an inference outage (urgent rules, then knowledge base
+retrieval, then keyword rules); "keyword_rules" times the rules alone.
+
+Usage: python benchmarks/bench_fallback.py [--messages 50000] [--json results.json]
+"""
+import argparse
+import time
+
+from common import print_table, summarize_latencies, write_results
+
+from backend.ai_doctor import get_fallback_response
+from backend.symptom_rules import matcher
+
+SAMPLE_MESSAGES = [
+    "Hello doctor, good morning",
+    "I have fever and headache since yesterday",
+    "My child has been vomiting and has diarrhea",
+    "I feel chest pain and I am short of breath",
+    "There is an itchy rash on my arm",
+    "I can't sleep at night, insomnia for weeks",
+    "My blood sugar is very high, I have diabetes",
+    "Thank you so much for the advice",
+    "I have been feeling anxious and stressed at work lately and I cannot focus",
+    "What should I do about this?",
+]
+
+
+CONTEXTS = [
+    {"location": "Lilongwe"},
+    {"location": "Blantyre", "age": 34},
+    {"location": "Zomba", "age": 6},
+]
+
+
+def measure(respond, count: int) -> dict:
+    messages = [SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)] for i in range(count)]
+    for i, message in enumerate(messages[:1000]):  # warm-up
+        respond(message, CONTEXTS[i % len(CONTEXTS)])
+
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for i, message in enumerate(messages):
+        context = CONTEXTS[i % len(CONTEXTS)]
+        t = clock()
+        respond(message, context)
+        latencies.append(clock() - t)
+    return summarize_latencies(latencies, clock() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = {
+        "fallback_response": measure(get_fallback_response, args.messages),
+        "keyword_rules": measure(matcher.respond, args.messages),
+    }
+    print_table(results)
+    if args.json:
+        write_results(args.json, "fallback", results, {"messages": args.messages})
+
+
+if __name__ == "__main__":
+    main()
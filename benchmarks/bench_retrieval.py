@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for the retrieval-based offline doctor.
+
+The shipped knowledge base is padded with synthetic entries (recombined
+symptom phrases) to show how answer latency scales with the number of entries,
+and how long building versus memory-mapping the index takes.
+
+Usage: python benchmarks/bench_retrieval.py [--sizes 0,10000,50000] [--queries 2000] [--json results.json]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from bench_fallback import SAMPLE_MESSAGES
+from common import print_table, summarize_latencies, write_results
+
+from backend.retrieval import (KnowledgeEntry, RetrievalDoctor, RetrievalIndex, fingerprint,
+                               knowledge_base_paths, load_entries)
+
+
+def synthetic_entries(entries: list, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    vocabulary = " ".join(entry.symptoms for entry in entries).split()
+    return [
+        KnowledgeEntry(f"synthetic-{i}", "general", f"Synthetic entry {i}",
+                       " ".join(rng.sample(vocabulary, 12)), "Synthetic advice.")
+        for i in range(count)
+    ]
+
+
+def measure(extra_entries: int, queries: int) -> dict:
+    base = load_entries(knowledge_base_paths())
+    entries = base + synthetic_entries(base, extra_entries)
+
+    start = time.perf_counter()
+    index = RetrievalIndex.build(entries)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key = fingerprint(entries)
+        index.save(tmp, key)
+        start = time.perf_counter()
+        index = RetrievalIndex.load(tmp, key)
+        load_seconds = time.perf_counter() - start
+
+        doctor = RetrievalDoctor(entries, index)
+        context = {"location": "Lilongwe"}
+        for message in SAMPLE_MESSAGES * 10:  # warm-up
+            doctor.answer(message, context)
+
+        latencies = []
+        clock = time.perf_counter
+        start = clock()
+        for i in range(queries):
+            t = clock()
+            doctor.answer(SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], context)
+            latencies.append(clock() - t)
+        result = summarize_latencies(latencies, clock() - start)
+
+    result["entries"] = len(entries)
+    result["build_s"] = round(build_seconds, 3)
+    result["mmap_load_ms"] = round(load_seconds * 1000, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="0,10000,50000", help="synthetic entries to add, comma-separated")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(size) for size in args.sizes.split(",")):
+        result = measure(size, args.queries)
+        results[f"retrieval {result['entries']} entries"] = result
+    print_table(results)
+    for key, result in results.items():
+        print(f"{key}: index build {result['build_s']:.2f}s, memory-mapped load {result['mmap_load_ms']:.1f}ms")
+    if args.json:
+        write_results(args.json, "retrieval", results, {"sizes": args.sizes, "queries": args.queries})
+
+
+if __name__ == "__main__":
+    main()
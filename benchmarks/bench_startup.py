@@ -0,0 +1,76 @@
+"""
+Startup benchmark: cold import time of backend.main and time to first response.
+
+Each sample runs in a fresh interpreter so nothing is cached between runs.
+"Import" is `import backend.main`; "first request" starts uvicorn against a
+temporary SQLite database and polls /health until it answers.
+
+Usage: python benchmarks/bench_startup.py [--samples 5]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time() -> float:
+    code = "import time; t = time.perf_counter(); import backend.main; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)
+    return float(output)
+
+
+def first_request_time(database_url: str) -> float:
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, AUTO_MIGRATE="1")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(label: str, samples: list):
+    print(f"{label:>14}: median {statistics.median(samples) * 1000:7.1f} ms, "
+          f"min {min(samples) * 1000:7.1f} ms, max {max(samples) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    summarize("import", [import_time() for _ in range(args.samples)])
+    with tempfile.TemporaryDirectory() as tmp:
+        summarize("first request", [
+            first_request_time(f"sqlite:///{os.path.join(tmp, f'startup{i}.db')}") for i in range(args.samples)
+        ])
+
+
+if __name__ == "__main__":
+    main()
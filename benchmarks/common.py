@@ -0,0 +1,80 @@
+"""
+Shared helpers for the benchmark scripts: latency summaries and JSON results.
+
+Every benchmark can write its results as JSON with --json PATH so runs can be
+stored and compared; `compare_results` flags regressions between two runs.
+"""
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_latencies(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    """
+    Throughput and latency percentiles (milliseconds) for one endpoint or operation
+    """
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "throughput": count / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(values) / count * 1000 if count else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if count else 0.0,
+    }
+
+
+def run_metadata() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path: str, name: str, results: dict, parameters: dict = None):
+    document = {"benchmark": name, "meta": run_metadata(), "parameters": parameters or {}, "results": results}
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = 0.2) -> list:
+    """
+    Regressions between two result documents.
+
+    A result regresses when its p95 latency grows, or its throughput drops, by
+    more than `tolerance` (a fraction) relative to the baseline.
+    """
+    regressions = []
+    for key, new in current.get("results", {}).items():
+        old = baseline.get("results", {}).get(key)
+        if not isinstance(old, dict) or not isinstance(new, dict):
+            continue
+        if old.get("p95_ms") and new.get("p95_ms", 0) > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {old['p95_ms']:.1f} ms -> {new['p95_ms']:.1f} ms")
+        if old.get("throughput") and new.get("throughput", 0) < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {old['throughput']:.1f}/s -> {new['throughput']:.1f}/s")
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'':<22}{'count':>8}{'errors':>8}{'per sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for key, row in results.items():
+        print(f"{key:<22}{row['count']:>8}{row['errors']:>8}{row['throughput']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
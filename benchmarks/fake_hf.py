@@ -0,0 +1,75 @@
+"""
+Local stand-in for the Hugging Face inference endpoint.
+
+Speaks the same protocol backend.inference uses: single and batched
+text-generation requests, plus token streaming when "stream" is true.
+Latency and error rate are configurable so load tests can simulate a slow or
+flaky backend.
+
+Usage: python benchmarks/fake_hf.py [--port 9100] [--latency-ms 200] [--jitter-ms 50] [--error-rate 0.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = ("Rest, drink plenty of clean water and monitor your symptoms. "
+          "If they get worse or last more than two days, please visit your nearest clinic.")
+
+
+def create_fake_app(latency_ms: float = 200.0, jitter_ms: float = 50.0, error_rate: float = 0.0,
+                    token_delay_ms: float = 20.0) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+
+    async def simulate_latency():
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+    @app.post("/models/{model_path:path}")
+    async def generate(model_path: str, request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        await simulate_latency()
+        if random.random() < error_rate:
+            return JSONResponse({"error": "Model is overloaded"}, status_code=503)
+
+        inputs = body["inputs"]
+        if body.get("stream"):
+            async def tokens():
+                for word in ANSWER.split(" "):
+                    await asyncio.sleep(token_delay_ms / 1000)
+                    yield "data: " + json.dumps({"token": {"text": word + " ", "special": False}}) + "\n\n"
+            return StreamingResponse(tokens(), media_type="text/event-stream")
+        if isinstance(inputs, list):
+            return [[{"generated_text": f"{prompt}Answer: {ANSWER}"}] for prompt in inputs]
+        return [{"generated_text": f"{inputs}Answer: {ANSWER}"}]
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FAKE_HF_PORT", 9100)))
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    app = create_fake_app(args.latency_ms, args.jitter_ms, args.error_rate, args.token_delay_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
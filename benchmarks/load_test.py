@@ -0,0 +1,235 @@
+"""
+Load test for /users/register, /users/login and /chat/message.
+
+Starts the fake inference server (fake_hf.py) and the app (server.py) against a
+temporary SQLite database, then drives concurrent users through three phases:
+everyone registers, everyone logs in, then everyone chats for --duration
+seconds. Reports throughput and p50/p95/p99 latency per endpoint.
+
+Usage:
+    python benchmarks/load_test.py --users 50 --duration 20 --json run.json
+    python benchmarks/load_test.py --compare baseline.json --json run.json
+
+With --compare the exit status is 1 when any endpoint regressed by more than
+--tolerance (p95 latency up or throughput down).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import ROOT, compare_results, print_table, summarize_latencies, write_results
+
+CHAT_MESSAGES = [
+    "Hello doctor",
+    "I have fever and headache since yesterday",
+    "My child has diarrhea, what should I do?",
+    "I have a cough and sore throat",
+    "I feel dizzy when I stand up",
+    "Thank you for the advice",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(process.args)} exited during startup")
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def record(self, endpoint: str, started: float, status: int):
+        ok = 200 <= status < 300
+        self.latencies.setdefault(endpoint, [])
+        self.errors.setdefault(endpoint, 0)
+        if ok:
+            self.latencies[endpoint].append(time.perf_counter() - started)
+        else:
+            self.errors[endpoint] += 1
+        self.statuses.setdefault(endpoint, {})
+        self.statuses[endpoint][str(status)] = self.statuses[endpoint].get(str(status), 0) + 1
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.record(endpoint, started, 0)
+            return None
+        self.record(endpoint, started, response.status_code)
+        return response
+
+
+async def run_load(base_url: str, users: int, duration: float, think_ms: float) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    results = {}
+    run_id = random.randrange(1 << 30)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        credentials = [{"username": f"load{run_id}_{i}", "password": f"pw-{i}", "age": 20 + i % 50,
+                        "location": random.choice(["Lilongwe", "Blantyre", "Mzuzu"])} for i in range(users)]
+
+        async def register(user):
+            response = await recorder.call(client, "register", "POST", "/users/register", json=user)
+            return response.json()["user_id"] if response is not None and response.status_code == 200 else None
+
+        start = time.perf_counter()
+        user_ids = await asyncio.gather(*(register(user) for user in credentials))
+        results["POST /users/register"] = summarize_latencies(
+            recorder.latencies.get("register", []), time.perf_counter() - start, recorder.errors.get("register", 0))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            recorder.call(client, "login", "POST", "/users/login",
+                          json={"username": user["username"], "password": user["password"]})
+            for user, user_id in zip(credentials, user_ids) if user_id is not None
+        ))
+        results["POST /users/login"] = summarize_latencies(
+            recorder.latencies.get("login", []), time.perf_counter() - start, recorder.errors.get("login", 0))
+
+        deadline = time.perf_counter() + duration
+
+        async def chat(user_id):
+            conversation_id = None
+            while time.perf_counter() < deadline:
+                response = await recorder.call(client, "chat", "POST", "/chat/message", json={
+                    "user_id": user_id,
+                    "message": random.choice(CHAT_MESSAGES),
+                    "conversation_id": conversation_id,
+                })
+                if response is not None and response.status_code == 200:
+                    conversation_id = response.json().get("conversation_id")
+                if think_ms:
+                    await asyncio.sleep(random.expovariate(1000 / think_ms))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(chat(user_id) for user_id in user_ids if user_id is not None))
+        results["POST /chat/message"] = summarize_latencies(
+            recorder.latencies.get("chat", []), time.perf_counter() - start, recorder.errors.get("chat", 0))
+
+    for key, endpoint in (("POST /users/register", "register"), ("POST /users/login", "login"),
+                          ("POST /chat/message", "chat")):
+        results[key]["status_codes"] = recorder.statuses.get(endpoint, {})
+    return results
+
+
+def run_micro() -> dict:
+    import bench_bcrypt
+    import bench_fallback
+
+    return {
+        "micro fallback": bench_fallback.measure(20000),
+        "micro bcrypt": bench_bcrypt.measure(int(os.environ.get("BCRYPT_ROUNDS", "12")), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of chat traffic")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's messages")
+    parser.add_argument("--workers", type=int, default=1, help="WEB_CONCURRENCY for the app")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake inference latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake inference error rate")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--micro", action="store_true", help="also run the fallback and bcrypt micro-benchmarks")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env AI_CACHE_ENABLED=1")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    parser.add_argument("--compare", help="baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    fake_port, app_port = free_port(), free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'load.db')}",
+            HF_API_KEY="load-test",
+            HF_API_URL=f"http://127.0.0.1:{fake_port}/models/medalpaca/medalpaca-7b",
+            BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+            # Measure the inference path, not cache hits or the per-client limit, unless asked otherwise
+            AI_CACHE_ENABLED="0",
+            RATE_LIMIT_PER_MINUTE="0",
+            # Every simulated user registers at once; the default queue (4 x cores) would 503 them
+            HASH_MAX_PENDING=str(max(64, 2 * args.users)),
+            PORT=str(app_port),
+            WEB_CONCURRENCY=str(args.workers),
+        )
+        env.update(item.split("=", 1) for item in args.env)
+        try:
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "benchmarks", "fake_hf.py"), "--port", str(fake_port),
+                 "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                 "--error-rate", str(args.error_rate)],
+                cwd=ROOT, env=env,
+            ))
+            subprocess.run([sys.executable, "-m", "backend.migrate"], cwd=ROOT, env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            processes.append(subprocess.Popen(
+                [sys.executable, "server.py"], cwd=ROOT, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+
+            async def go():
+                await wait_until_up(f"http://127.0.0.1:{fake_port}/stats", processes[0])
+                await wait_until_up(f"http://127.0.0.1:{app_port}/health", processes[1])
+                return await run_load(f"http://127.0.0.1:{app_port}", args.users, args.duration, args.think_ms)
+
+            results = asyncio.run(go())
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+
+    if args.micro:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+        results.update(run_micro())
+
+    print_table(results)
+    parameters = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    if args.json:
+        write_results(args.json, "load_test", results, parameters)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, {"results": results}, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 // api.js - API configuration and utility functions
 // For Render deployment, we'll use environment-specific API base URL
-const API_BASE_URL = process?.env?.REACT_APP_API_URL || ''; // Will be set during deployment
+const API_BASE_URL = (typeof process !== 'undefined' && process.env?.REACT_APP_API_URL) || ''; // Will be set during deployment
 
 // Store user session in localStorage
 class SessionManager {
@@ -81,14 +81,70 @@ class APIService {
     }
 
     // Chat methods
-    static async sendMessage(message, userId) {
+    static async sendMessage(message, userId, conversationId = null) {
         return this.request('/chat/message', {
             method: 'POST',
             body: JSON.stringify({
                 user_id: userId,
-                message: message
+                message: message,
+                conversation_id: conversationId
+            })
+        });
+    }
+
+    // Stream the doctor's reply; onChunk is called with each piece of text as it arrives
+    static async streamMessage(message, userId, onChunk, conversationId = null) {
+        const endpoint = '/chat/stream';
+        const url = API_BASE_URL ? `${API_BASE_URL}${endpoint}` : `/api${endpoint}`;
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                user_id: userId,
+                message: message,
+                conversation_id: conversationId
             })
         });
+
+        if (!response.ok || !response.body) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.detail || data.message || 'Request failed');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let fullText = '';
+        let streamConversationId = conversationId;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Server-sent events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const event = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const dataLine = event.split('\n').find(line => line.startsWith('data:'));
+                if (!dataLine) continue;
+
+                const payload = JSON.parse(dataLine.slice(5));
+                if (event.startsWith('event: done')) {
+                    streamConversationId = payload.conversation_id ?? streamConversationId;
+                } else if (payload.text) {
+                    fullText += payload.text;
+                    onChunk(payload.text);
+                }
+            }
+        }
+
+        return { response: fullText.trim(), conversation_id: streamConversationId };
     }
 
     // Health check
@@ -173,6 +229,12 @@ class MockAPIService {
 
         return { response: response };
     }
+
+    static async streamMessage(message, userId, onChunk, conversationId = null) {
+        const result = await this.sendMessage(message, userId, conversationId);
+        onChunk(result.response);
+        return result;
+    }
 }
 
 // Check API availability and use appropriate service
@@ -15,6 +15,9 @@ document.addEventListener('DOMContentLoaded', async function() {
 
     if (!chatMessages) return;
 
+    // Messages sent from this page are saved to one conversation
+    let conversationId = null;
+
     // Auto-scroll to bottom of chat
     function scrollToBottom() {
         chatMessages.scrollTop = chatMessages.scrollHeight;
@@ -37,6 +40,7 @@ document.addEventListener('DOMContentLoaded', async function() {
         chatMessages.appendChild(messageDiv);
 
         scrollToBottom();
+        return messageContent.querySelector('p');
     }
 
     // Send message to API
@@ -51,14 +55,27 @@ document.addEventListener('DOMContentLoaded', async function() {
         // Show loading indicator
         loadingIndicator.classList.remove('hidden');
 
+        let replyParagraph = null;
+
         try {
             const user = window.SessionManager.getUser();
-            const response = await window.APIService.sendMessage(message, user.id);
 
-            // Add doctor response to chat
-            addMessage(response.response, false);
+            // Render the doctor's reply incrementally as chunks stream in
+            const result = await window.APIService.streamMessage(message, user.id, chunk => {
+                if (!replyParagraph) {
+                    loadingIndicator.classList.add('hidden');
+                    replyParagraph = addMessage('', false);
+                }
+                replyParagraph.textContent += chunk;
+                scrollToBottom();
+            }, conversationId);
+            conversationId = result.conversation_id ?? conversationId;
         } catch (error) {
-            addMessage(`Error: ${error.message}`, false);
+            if (replyParagraph) {
+                replyParagraph.textContent += ` [Error: ${error.message}]`;
+            } else {
+                addMessage(`Error: ${error.message}`, false);
+            }
         } finally {
             // Hide loading indicator
             loadingIndicator.classList.add('hidden');
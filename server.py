@@ -1,7 +1,99 @@
 import uvicorn
+import glob
 import os
-from backend.main import app
+import shutil
+import tempfile
+from dotenv import load_dotenv
+
+from backend.workers import available_cores
+
+
+def serving_options():
+    """
+    Serving configuration from the environment, alongside the existing PORT
+    """
+    max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+    return {
+        "port": int(os.environ.get("PORT", 8000)),
+        "workers": int(os.environ.get("WEB_CONCURRENCY", available_cores())),
+        "preload": os.environ.get("PRELOAD_APP", "1") != "0",
+        # Recycle workers after this many requests to bound memory growth (0 disables)
+        "max_requests": max_requests,
+        "max_requests_jitter": int(os.environ.get("MAX_REQUESTS_JITTER", max_requests // 10)),
+        # Seconds in-flight requests get to finish after SIGTERM
+        "graceful_timeout": int(os.environ.get("GRACEFUL_TIMEOUT", 30)),
+        # Must exceed the slowest legitimate request (HF_TIMEOUT, streaming replies)
+        "timeout": int(os.environ.get("WORKER_TIMEOUT", 120)),
+    }
+
+
+def prepare_metrics_dir():
+    """
+    Give the workers a fresh directory to pool their metrics in, so /metrics
+    shows server totals whichever worker answers the scrape; returns the
+    directory if it is a temporary one to remove on exit
+    """
+    directory = os.environ.get("METRICS_MULTIPROC_DIR")
+    if not directory:
+        directory = os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="healthco-metrics-")
+        return directory
+    os.makedirs(directory, exist_ok=True)
+    # Snapshots from a previous run would add its totals to this one's
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+    return None
+
+
+def run_single(options):
+    from backend.main import app
+
+    # Uvicorn stops accepting connections on SIGTERM and waits for in-flight requests
+    uvicorn.run(app, host="0.0.0.0", port=options["port"],
+                timeout_graceful_shutdown=options["graceful_timeout"])
+
+
+def run_workers(options):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # No gunicorn (e.g. Windows): uvicorn's own supervisor, without preload
+        uvicorn.run("backend.main:app", host="0.0.0.0", port=options["port"],
+                    workers=options["workers"],
+                    limit_max_requests=options["max_requests"] or None,
+                    timeout_graceful_shutdown=options["graceful_timeout"])
+        return
+
+    class HealthCoApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{options['port']}")
+            self.cfg.set("workers", options["workers"])
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            # Import the app once in the master so workers fork with it already loaded;
+            # engines, pools and background threads are still created per worker by the lifespan
+            self.cfg.set("preload_app", options["preload"])
+            self.cfg.set("max_requests", options["max_requests"])
+            self.cfg.set("max_requests_jitter", options["max_requests_jitter"])
+            self.cfg.set("graceful_timeout", options["graceful_timeout"])
+            self.cfg.set("timeout", options["timeout"])
+
+        def load(self):
+            from backend.main import app
+            return app
+
+    HealthCoApplication().run()
+
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    load_dotenv()
+    options = serving_options()
+    # Workers split server-wide limits (hashing processes, model slots, rate limits) by this
+    os.environ["WEB_CONCURRENCY"] = str(options["workers"])
+    if options["workers"] > 1:
+        temporary = prepare_metrics_dir()
+        try:
+            run_workers(options)
+        finally:
+            if temporary:
+                shutil.rmtree(temporary, ignore_errors=True)
+    else:
+        run_single(options)
@@ -0,0 +1,180 @@
+"""
+Rate limiting and the priority queue in front of the model.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend import admission
+from backend.admission import AdmissionController, AdmissionRejected, RateLimiter
+from backend.main import admit_chat
+from backend.models import ChatRequest
+from backend.symptom_rules import PRIORITY_URGENT
+
+URGENT = "I have severe chest pain"
+NORMAL = "I have a headache"
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "6")
+    monkeypatch.setenv("RATE_LIMIT_BURST", "2")
+    monkeypatch.delenv("RATE_LIMIT_URGENT_PER_MINUTE", raising=False)
+    monkeypatch.delenv("RATE_LIMIT_URGENT_BURST", raising=False)
+    monkeypatch.setattr(admission, "_limiter", None)
+    monkeypatch.setattr(admission, "_urgent_limiter", None)
+
+
+def test_rate_limiter_allows_a_burst_then_rejects():
+    limiter = RateLimiter(per_minute=60, burst=3)
+    for _ in range(3):
+        limiter.check(1)
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check(1)
+    assert rejected.value.retry_after == 1
+    # Other users have buckets of their own
+    limiter.check(2)
+    assert limiter.stats()["limited"] == 1
+
+
+def test_rate_limiter_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(per_minute=60, burst=1)
+    limiter.check(1)
+    with pytest.raises(AdmissionRejected):
+        limiter.check(1)
+    now[0] += 1.0
+    limiter.check(1)
+
+
+def test_rate_limiter_disabled_at_zero():
+    limiter = RateLimiter(per_minute=0, burst=0)
+    for _ in range(100):
+        limiter.check(1)
+
+
+def test_rate_limiter_forgets_least_recent_users():
+    limiter = RateLimiter(per_minute=60, burst=1, max_users=2)
+    for user_id in (1, 2, 3):
+        limiter.check(user_id)
+    assert limiter.stats()["tracked_users"] == 2
+    limiter.check(1)  # evicted, so a full bucket again
+
+
+def test_urgent_messages_use_a_separate_larger_bucket(limiters):
+    for _ in range(2):
+        admit_chat(ChatRequest(user_id=7, message=NORMAL))
+    with pytest.raises(HTTPException) as limited:
+        admit_chat(ChatRequest(user_id=7, message=NORMAL))
+    assert limited.value.status_code == 429
+
+    # Normal allowance used up, yet an emergency still gets through...
+    for _ in range(6):
+        assert admit_chat(ChatRequest(user_id=7, message=URGENT)) == PRIORITY_URGENT
+    # ...but urgent wording is not a way around the limit
+    with pytest.raises(HTTPException) as limited:
+        admit_chat(ChatRequest(user_id=7, message=URGENT))
+    assert limited.value.status_code == 429
+    assert "Retry-After" in limited.value.headers
+
+
+def test_urgent_bucket_follows_its_own_settings(limiters, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_URGENT_BURST", "1")
+    admit_chat(ChatRequest(user_id=8, message=URGENT))
+    with pytest.raises(HTTPException):
+        admit_chat(ChatRequest(user_id=8, message=URGENT))
+    admit_chat(ChatRequest(user_id=8, message=NORMAL))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_controller_admits_up_to_max_concurrent_then_queues():
+    async def go():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1)
+        await controller.acquire(1)
+        waiter = asyncio.ensure_future(controller.acquire(1))
+        await asyncio.sleep(0)
+        assert not waiter.done() and controller.stats()["waiting"]["normal"] == 1
+        controller.release()
+        await waiter
+        assert controller.active == 1
+        controller.release()
+        assert controller.active == 0
+
+    run(go())
+
+
+def test_controller_serves_urgent_waiters_first():
+    async def go():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1)
+        await controller.acquire(1)
+        order = []
+
+        async def wait(priority, name):
+            await controller.acquire(priority)
+            order.append(name)
+            controller.release()
+
+        tasks = [asyncio.ensure_future(wait(2, "low")), asyncio.ensure_future(wait(1, "normal")),
+                 asyncio.ensure_future(wait(PRIORITY_URGENT, "urgent"))]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(go()) == ["urgent", "normal", "low"]
+
+
+def test_full_queue_rejects_but_urgent_displaces_the_lowest_waiter():
+    async def go():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1)
+        await controller.acquire(1)
+        low = asyncio.ensure_future(controller.acquire(2))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(1)
+        assert rejected.value.reason == "queue full"
+
+        urgent = asyncio.ensure_future(controller.acquire(PRIORITY_URGENT))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as displaced:
+            await low
+        assert displaced.value.reason == "displaced by an urgent request"
+        controller.release()
+        await urgent
+        assert controller.stats()["evicted"] == 1
+
+    run(go())
+
+
+def test_queue_timeout_rejects_and_leaves_the_queue():
+    async def go():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await controller.acquire(1)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(1)
+        assert rejected.value.reason == "queue timeout" and rejected.value.retry_after >= 1
+        stats = controller.stats()
+        assert stats["timed_out"] == 1 and stats["waiting"]["normal"] == 0
+
+    run(go())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def go():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1)
+        await controller.acquire(1)
+        waiter = asyncio.ensure_future(controller.acquire(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        controller.release()
+        assert controller.active == 0
+        await controller.acquire(1)
+
+    run(go())
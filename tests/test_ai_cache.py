@@ -0,0 +1,61 @@
+"""
+Cached model answers must never carry one patient's name to another.
+"""
+import asyncio
+
+import pytest
+
+from backend import ai_doctor, response_cache
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """
+    A fake model that greets whoever the prompt names; records every prompt
+    """
+    prompts = []
+
+    async def generate(prompt):
+        prompts.append(prompt)
+        name = prompt.split("Patient details: ")[1].split(",")[0]
+        first, _, last = name.partition(" ")
+        return f"Hello {first}. Mr. {last or first}, drink plenty of fluids and rest."
+
+    monkeypatch.setenv("HF_API_KEY", "test")
+    monkeypatch.delenv("AI_CACHE_PATH", raising=False)
+    monkeypatch.setattr(response_cache, "_cache", None)
+    monkeypatch.setattr(ai_doctor, "_generate", generate)
+    return prompts
+
+
+def ask(name, use_cache=True):
+    context = {"full_name": name, "age": 30, "location": "Zomba"}
+    return asyncio.run(ai_doctor.get_ai_response("I have a mild cough", context, use_cache=use_cache))
+
+
+def test_cached_prompt_and_answer_leave_out_the_name(model):
+    first = ask("Chikondi Banda")
+    assert "Chikondi" not in model[0] and "Banda" not in model[0]
+    assert "Chikondi" not in first and "Banda" not in first
+
+    second = ask("Grace Phiri")
+    assert second == first
+    assert len(model) == 1
+
+
+def test_name_is_used_when_the_answer_is_not_cached(model):
+    answer = ask("Chikondi Banda", use_cache=False)
+    assert "Chikondi Banda" in model[0]
+    assert "Hello Chikondi" in answer
+    assert response_cache.get_cache().stats()["entries"] == 0
+
+
+def test_answer_mentioning_a_name_token_is_not_cached(model, monkeypatch):
+    async def generate(prompt):
+        return "Keep hope: a mild cough usually clears within two weeks."
+
+    monkeypatch.setattr(ai_doctor, "_generate", generate)
+    ask("Hope Mwale")
+    assert response_cache.get_cache().stats()["entries"] == 0
+    ask("Chikondi Banda")
+    assert response_cache.get_cache().stats()["entries"] == 1
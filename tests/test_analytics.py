@@ -0,0 +1,109 @@
+"""
+Rebuilding the symptom rollups while the app keeps writing and reading them.
+"""
+from collections import Counter
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend import analytics, history
+from backend.models import Base, Conversation, Message, SymptomDailyCount, User
+
+DAY = datetime(2026, 3, 2, 9, 0)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'analytics.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(id=1, username="zomba", hashed_password="x", location="Zomba"))
+        db.add(Conversation(id=1, user_id=1))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+def add_messages(factory, *contents, count=True):
+    """
+    Store user messages the way the history writer does: tagged, with their counts, in one transaction
+    """
+    with factory() as db:
+        rows = [{"conversation_id": 1, "user_id": 1, "role": "user", "content": content, "timestamp": DAY,
+                 "category": analytics.classify(content)} for content in contents]
+        db.execute(insert(Message), rows)
+        if count:
+            analytics.apply_counts(db, Counter(analytics.rollup_key(DAY, "Zomba", row["category"]) for row in rows))
+        db.commit()
+
+
+def fever_count(factory) -> int:
+    with factory() as db:
+        trends = analytics.symptom_trends(db, days=7, until=date(2026, 3, 3))
+    return sum(entry["count"] for entry in trends["categories"] if entry["category"] == "fever")
+
+
+def test_backfill_counts_each_message_once(session_factory):
+    add_messages(session_factory, "I have a fever", "fever and chills")
+    add_messages(session_factory, "my child has a high fever", count=False)  # the writer lost these counts
+    result = analytics.backfill(session_factory, chunk_size=2)
+    assert result["messages"] == 3
+    assert fever_count(session_factory) == 3
+    analytics.backfill(session_factory)
+    assert fever_count(session_factory) == 3
+
+
+def test_readers_keep_the_old_totals_until_the_swap(session_factory, monkeypatch):
+    add_messages(session_factory, *["I have a fever"] * 4)
+    seen = []
+
+    def between_chunks(seconds):
+        # Mid-run: readers still see every message, and the live writer keeps going
+        seen.append(fever_count(session_factory))
+        if len(seen) == 1:
+            add_messages(session_factory, "fever again today")
+
+    monkeypatch.setattr(analytics.time, "sleep", between_chunks)
+    analytics.backfill(session_factory, chunk_size=1, pause=0.01)
+
+    assert seen[0] == 4 and all(count == 5 for count in seen[1:])
+    assert fever_count(session_factory) == 5
+
+
+def rollups(factory) -> dict:
+    with factory() as db:
+        return {(row.day, row.location, row.category): row.count for row in db.query(SymptomDailyCount)}
+
+
+def test_backfill_over_live_written_messages_keeps_the_totals(session_factory):
+    with session_factory() as db:
+        db.add(User(id=2, username="nowhere", hashed_password="x"))
+        db.add(Conversation(id=2, user_id=2))
+        db.commit()
+    writer = history.MessageWriter(session_factory, flush_interval=0.05)
+    writer.start()
+    # Locations as the chat path passes them: the requesting user's profile at the time
+    writer.enqueue(1, 1, "user", "I have a fever", DAY, "Zomba")
+    writer.enqueue(1, 1, "assistant", "Rest and drink water", DAY)
+    writer.enqueue(2, 2, "user", "I have a cough", DAY, None)
+    writer.stop()
+    with session_factory() as db:
+        # Both users update their profiles afterwards
+        db.get(User, 1).location = "Blantyre"
+        db.get(User, 2).location = "Mzuzu"
+        db.commit()
+    live = rollups(session_factory)
+    assert (DAY.date(), "Zomba", "fever") in live and (DAY.date(), analytics.UNKNOWN_LOCATION, "respiratory") in live
+
+    analytics.backfill(session_factory, chunk_size=1)
+    assert rollups(session_factory) == live
+
+
+def test_messages_without_a_stored_location_use_the_users(session_factory):
+    add_messages(session_factory, "I have a fever", count=False)  # written before messages.location existed
+    analytics.backfill(session_factory)
+    assert rollups(session_factory) == {(DAY.date(), "Zomba", "fever"): 1}
+
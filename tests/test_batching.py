@@ -0,0 +1,88 @@
+"""
+MicroBatcher: results reach the right caller, and abandoned batches stop.
+"""
+import asyncio
+
+import pytest
+
+from backend.batching import MicroBatcher
+
+
+def test_each_caller_gets_its_own_result():
+    async def handler(items):
+        return [item * 2 for item in items]
+
+    async def go():
+        batcher = MicroBatcher(handler, max_batch_size=4, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(go())
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert stats["batches"] == 2
+
+
+def test_handler_error_reaches_every_caller():
+    async def handler(items):
+        raise RuntimeError("inference down")
+
+    async def go():
+        batcher = MicroBatcher(handler, max_batch_size=2, max_wait=0.01)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    for result in asyncio.run(go()):
+        assert isinstance(result, RuntimeError)
+
+
+def test_batch_is_cancelled_when_every_caller_gives_up():
+    finished, cancelled = [], []
+
+    async def handler(items):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(items)
+            raise
+        finished.append(items)
+        return items
+
+    async def go():
+        batcher = MicroBatcher(handler, max_batch_size=8, max_wait=0.01)
+        outcomes = await asyncio.gather(*(asyncio.wait_for(batcher.submit(i), 0.1) for i in range(3)),
+                                        return_exceptions=True)
+        await asyncio.sleep(0.05)
+        # Checked inside the loop: asyncio.run cancels leftover tasks on the way out
+        assert cancelled == [[0, 1, 2]]
+        assert not batcher._tasks
+        return outcomes
+
+    outcomes = asyncio.run(go())
+    assert all(isinstance(outcome, asyncio.TimeoutError) for outcome in outcomes)
+    assert finished == []
+
+
+def test_batch_keeps_running_while_a_caller_still_waits():
+    async def handler(items):
+        await asyncio.sleep(0.2)
+        return items
+
+    async def go():
+        batcher = MicroBatcher(handler, max_batch_size=8, max_wait=0.01)
+        impatient = asyncio.wait_for(batcher.submit("a"), 0.05)
+        return await asyncio.gather(impatient, batcher.submit("b"), return_exceptions=True)
+
+    impatient, patient = asyncio.run(go())
+    assert isinstance(impatient, asyncio.TimeoutError)
+    assert patient == "b"
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 3])
+def test_full_batches_dispatch_without_waiting(max_batch_size):
+    async def handler(items):
+        return items
+
+    async def go():
+        batcher = MicroBatcher(handler, max_batch_size=max_batch_size, max_wait=10)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), 1)
+
+    assert asyncio.run(go()) == [0, 1, 2]
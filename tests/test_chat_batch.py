@@ -0,0 +1,65 @@
+"""
+POST /chat/batch: one bad item never fails the rest of the batch.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import admission, database, history, main, profile_cache
+from backend.models import User
+
+
+@pytest.fixture(params=["0", "1"], ids=["sync", "async"])
+def client(request, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'batch.db'}")
+    monkeypatch.setenv("AUTO_MIGRATE", "1")
+    monkeypatch.setenv("DB_ASYNC", request.param)
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "0")
+    monkeypatch.setattr(admission, "_limiter", None)
+    monkeypatch.setattr(admission, "_urgent_limiter", None)
+    monkeypatch.setattr(profile_cache, "_cache", None)
+    monkeypatch.setattr(history, "_conversation_owners", history.OrderedDict())
+
+    async def fake_ai_response(message, context, use_cache=True, priority=None):
+        if "explode" in message:
+            raise RuntimeError("model backend fell over")
+        return f"Advice for {context['full_name']}: rest"
+
+    monkeypatch.setattr(main, "get_ai_response", fake_ai_response)
+    with TestClient(main.app) as test_client:
+        with database.SessionLocal() as db:
+            db.add(User(id=1, username="zomba", hashed_password="x", full_name="Chikondi", location="Zomba"))
+            db.commit()
+        yield test_client
+
+
+def test_each_item_gets_its_own_outcome(client):
+    response = client.post("/chat/batch", json={"items": [
+        {"user_id": 1, "message": "I have a headache"},
+        {"user_id": 999, "message": "I have a headache"},
+        {"user_id": 1, "message": "please explode"},
+        {"user_id": 1, "message": "I have a cough"},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["status_code"] for result in results] == [200, 404, 500, 200]
+
+    assert results[0]["response"] == "Advice for Chikondi: rest" and results[0]["conversation_id"]
+    assert results[1]["error"] == "User not found" and results[1]["response"] is None
+    assert results[2]["error"] == "Could not answer this message" and results[2]["response"] is None
+    assert results[3]["response"] and results[3]["conversation_id"] != results[0]["conversation_id"]
+
+
+def test_someone_elses_conversation_is_a_404_item(client):
+    first = client.post("/chat/batch", json={"items": [{"user_id": 1, "message": "I have a headache"}]})
+    conversation_id = first.json()["results"][0]["conversation_id"]
+    with database.SessionLocal() as db:
+        db.add(User(id=2, username="other", hashed_password="x"))
+        db.commit()
+
+    results = client.post("/chat/batch", json={"items": [
+        {"user_id": 2, "message": "hello", "conversation_id": conversation_id},
+        {"user_id": 1, "message": "hello again", "conversation_id": conversation_id},
+    ]}).json()["results"]
+    assert [result["status_code"] for result in results] == [404, 200]
+    assert results[0]["error"] == "Conversation not found" and results[1]["conversation_id"] == conversation_id
@@ -0,0 +1,152 @@
+"""
+The circuit breaker in front of the inference backend, on a fake clock.
+"""
+import asyncio
+
+import pytest
+
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def breaker(clock, **options):
+    settings = dict(window_size=4, min_calls=4, failure_rate_threshold=0.5, slow_call_seconds=5.0,
+                    slow_call_rate_threshold=0.75, open_seconds=30.0, half_open_max_calls=1)
+    settings.update(options)
+    return CircuitBreaker("test", clock=clock, **settings)
+
+
+def test_failures_count_only_once_min_calls_are_seen(clock):
+    cb = breaker(clock)
+    for _ in range(3):
+        assert cb.allow_request()
+        cb.record_failure(0.1)
+    # Three failures out of three, but fewer than min_calls: still closed
+    assert cb.state == CLOSED and cb.snapshot()["failure_rate"] == 1.0
+    cb.record_success(0.1)
+    assert cb.state == OPEN
+    assert cb.total_calls == 4 and cb.total_failures == 3
+
+
+def test_failure_rate_below_threshold_stays_closed(clock):
+    cb = breaker(clock)
+    for failed in (True, False, False, False, True, False):
+        (cb.record_failure if failed else cb.record_success)(0.1)
+    # The rolling window holds the last four calls: one failure in four
+    assert cb.state == CLOSED and cb.snapshot()["window_calls"] == 4
+    assert cb.snapshot()["failure_rate"] == 0.25
+
+
+def test_slow_calls_open_the_breaker(clock):
+    cb = breaker(clock)
+    for latency in (6.0, 6.0, 6.0, 0.1):
+        cb.record_success(latency)
+    assert cb.state == OPEN and cb.total_failures == 0
+
+
+def test_closed_open_half_open_closed(clock):
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record_failure(0.1)
+    assert cb.state == OPEN
+
+    # Open: rejected until open_seconds have passed
+    clock.now += 29.9
+    assert not cb.allow_request()
+    assert cb.snapshot()["retry_in"] == pytest.approx(0.1)
+    clock.now += 0.1
+    assert cb.allow_request()
+    assert cb.state == HALF_OPEN
+
+    # A successful probe closes it with a fresh window
+    cb.record_success(0.1)
+    assert cb.state == CLOSED and cb.snapshot()["window_calls"] == 0
+    assert cb.total_rejected == 1
+
+
+def test_failed_or_slow_probe_reopens(clock):
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.allow_request()
+    cb.record_failure(0.1)
+    assert cb.state == OPEN
+    assert not cb.allow_request()
+
+    clock.now += 30
+    assert cb.allow_request()
+    cb.record_success(6.0)
+    assert cb.state == OPEN
+
+
+def test_half_open_lets_one_probe_through(clock):
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.allow_request()
+    assert not cb.allow_request() and not cb.allow_request()
+    assert cb.total_rejected == 2
+
+    # A probe that never completes gives its slot back
+    cb.release()
+    assert cb.allow_request()
+    assert not cb.allow_request()
+
+
+def test_half_open_max_calls(clock):
+    cb = breaker(clock, half_open_max_calls=2)
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+    assert cb.allow_request() and cb.allow_request()
+    assert not cb.allow_request()
+
+
+def test_call_records_outcomes_and_rejects_when_open(clock):
+    cb = breaker(clock, min_calls=2, window_size=2)
+
+    async def fail():
+        clock.now += 1
+        raise RuntimeError("backend down")
+
+    async def go():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await cb.call(fail)
+        with pytest.raises(CircuitOpenError):
+            await cb.call(fail)
+
+    asyncio.run(go())
+    assert cb.state == OPEN and cb.last_latency == 1
+    assert cb.total_calls == 2 and cb.total_rejected == 1
+
+
+def test_cancelled_probe_does_not_hold_the_slot(clock):
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record_failure(0.1)
+    clock.now += 30
+
+    async def go():
+        probe = asyncio.ensure_future(cb.call(asyncio.Event().wait))
+        await asyncio.sleep(0)
+        assert cb.state == HALF_OPEN and not cb.allow_request()
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert cb.allow_request()
+
+    asyncio.run(go())
@@ -0,0 +1,127 @@
+"""
+Streaming history export: filters, resuming, the two formats and gzip, sync and async.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import export
+from backend.export import COLUMNS, Encoder, ExportFilter
+from backend.models import Base, Conversation, Message, User
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "export.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(id=1, username="zomba", hashed_password="x", location="Zomba"))
+        db.add(User(id=2, username="lilongwe", hashed_password="x", location="Lilongwe"))
+        db.add(Conversation(id=1, user_id=1, title="Fever"))
+        db.add(Conversation(id=2, user_id=2, title="Cough, dry"))
+        for day, (conversation_id, user_id, content) in enumerate([
+            (1, 1, "I have a fever"), (2, 2, 'a "dry" cough, at night'), (1, 1, "still feverish"),
+            (2, 2, "cough is better"), (1, 1, "fever gone\nthanks"),
+        ], start=1):
+            db.add(Message(conversation_id=conversation_id, user_id=user_id, role="user", content=content,
+                           timestamp=datetime(2026, 3, day, 9, 0)))
+        db.commit()
+    engine.dispose()
+    return path
+
+
+def export_bytes(db_path, export_filter=None, format="ndjson", compress=False, chunk_rows=2) -> bytes:
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        return b"".join(export.stream_export(engine, export_filter or ExportFilter(), Encoder(format, compress),
+                                             chunk_rows))
+    finally:
+        engine.dispose()
+
+
+def export_rows(db_path, export_filter=None) -> list:
+    return [json.loads(line) for line in export_bytes(db_path, export_filter).decode().splitlines()]
+
+
+def test_ndjson_rows_in_id_order(db_path):
+    rows = export_rows(db_path)
+    assert [row["id"] for row in rows] == [1, 2, 3, 4, 5]
+    assert list(rows[0]) == list(COLUMNS)
+    assert rows[1]["conversation_title"] == "Cough, dry" and rows[1]["location"] == "Lilongwe"
+    assert rows[4]["content"] == "fever gone\nthanks" and rows[4]["timestamp"] == "2026-03-05T09:00:00"
+
+
+def test_filters_combine(db_path):
+    def ids(**options):
+        return [row["id"] for row in export_rows(db_path, ExportFilter(**options))]
+
+    assert ids(user_id=2) == [2, 4]
+    assert ids(location="Zomba") == [1, 3, 5]
+    assert ids(since=datetime(2026, 3, 2), until=datetime(2026, 3, 4)) == [2, 3]
+    assert ids(location="Zomba", since=datetime(2026, 3, 2)) == [3, 5]
+    assert ids(location="Nowhere") == []
+
+
+def test_resume_after_the_last_id_received(db_path):
+    full = export_rows(db_path)
+    interrupted = full[:2]
+    resumed = export_rows(db_path, ExportFilter(after=interrupted[-1]["id"]))
+    assert interrupted + resumed == full
+    assert export_rows(db_path, ExportFilter(location="Zomba", after=3)) == [full[4]]
+
+
+def test_csv_has_a_header_and_quotes_fields(db_path):
+    text = export_bytes(db_path, format="csv").decode()
+    assert text.startswith(",".join(COLUMNS) + "\r\n")
+    rows = list(csv.reader(io.StringIO(text, newline="")))
+    assert rows[0] == list(COLUMNS) and len(rows) == 6
+    assert rows[2][COLUMNS.index("content")] == 'a "dry" cough, at night'
+    assert rows[5][COLUMNS.index("content")] == "fever gone\nthanks"
+
+
+@pytest.mark.parametrize("format", ["ndjson", "csv"])
+def test_gzip_is_one_stream_across_chunks(db_path, format):
+    plain = export_bytes(db_path, format=format)
+    compressed = export_bytes(db_path, format=format, compress=True, chunk_rows=1)
+    assert compressed[:2] == b"\x1f\x8b"
+    assert gzip.decompress(compressed) == plain
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        Encoder("xml")
+
+
+def test_async_export_matches_and_encodes_off_the_loop(db_path, monkeypatch):
+    threads = []
+    encode = Encoder.encode
+
+    def recording_encode(self, rows):
+        threads.append(threading.get_ident())
+        return encode(self, rows)
+
+    monkeypatch.setattr(Encoder, "encode", recording_encode)
+
+    async def go():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        try:
+            chunks = [chunk async for chunk in export.stream_export_async(
+                engine, ExportFilter(location="Zomba"), Encoder("csv", compress=True), chunk_rows=1)]
+        finally:
+            await engine.dispose()
+        return b"".join(chunks), threading.get_ident()
+
+    compressed, loop_thread = asyncio.run(go())
+    assert threads and loop_thread not in threads
+    expected = export_bytes(db_path, ExportFilter(location="Zomba"), format="csv")
+    assert gzip.decompress(compressed) == expected
@@ -0,0 +1,98 @@
+"""
+Safety regressions for the offline answers (knowledge base retrieval plus keyword rules).
+"""
+import pytest
+
+from backend.ai_doctor import get_fallback_response
+from backend.retrieval import build_doctor
+from backend.symptom_rules import PRIORITY_URGENT, matcher
+
+EMERGENCY = "seek emergency medical care immediately"
+CHILD_FEVER = "For a child with fever"
+ADULT_FEVER = "A fever is usually the body fighting an infection"
+
+
+@pytest.mark.parametrize("message", ["I have chest pain", "chest pain and short of breath", "my chest hurts"])
+def test_chest_pain_gets_emergency_advice(message):
+    assert matcher.priority(message) == PRIORITY_URGENT
+    answer = get_fallback_response(message, {"age": 40, "location": "Zomba"})
+    assert EMERGENCY in answer
+    # Not the milder answers similarity search used to pick
+    assert "muscles or ribs" not in answer
+    assert "asthma" not in answer.lower()
+    assert "pneumonia" not in answer.lower()
+
+
+def test_urgent_keyword_without_urgent_rule_gets_emergency_rule():
+    assert "call emergency services immediately" in matcher.respond("he is unconscious", urgent=True)
+
+
+@pytest.mark.parametrize("age", [30, 40])
+def test_adult_fever_gets_adult_advice(age):
+    answer = get_fallback_response("I have fever", {"age": age, "location": "Zomba"})
+    assert ADULT_FEVER in answer
+    assert CHILD_FEVER not in answer
+
+
+def test_parent_asking_about_child_gets_child_advice():
+    answer = get_fallback_response("my child has fever", {"age": 30, "location": "Zomba"})
+    assert CHILD_FEVER in answer
+
+
+def test_child_patient_does_not_get_adult_advice():
+    answer = get_fallback_response("I have fever", {"age": 8, "location": "Zomba"})
+    assert ADULT_FEVER not in answer
+    assert CHILD_FEVER in answer
+
+
+def test_urgent_entry_is_not_deduplicated_away():
+    doctor = build_doctor(related_ratio=0.9)
+    hits = [entry.id for _, entry in doctor.search("I have chest pain")]
+    assert {"chest-pain", "chest-muscle"} <= set(hits)
+    answer = doctor.answer("I have chest pain", {"age": 40})
+    assert "could be a heart attack" in answer
+    assert "muscles or ribs" not in answer
+
+
+@pytest.mark.parametrize("message", ["I feel suicidal", "I want to kill myself", "thinking about suicide",
+                                     "I want to end my life"])
+def test_self_harm_gets_the_crisis_response(message):
+    assert matcher.priority(message) == PRIORITY_URGENT
+    answer = get_fallback_response(message, {"location": "Zomba"})
+    assert "crisis helpline" in answer
+    assert "severe chest pain" not in answer
+    assert matcher.match_urgent(message).category == "self_harm"
+
+
+@pytest.mark.parametrize("message", ["I have a hospital appointment next week", "urgent question about my diet",
+                                     "which hospital is open on Sunday?"])
+def test_hospital_and_urgent_alone_are_not_urgent(message):
+    assert matcher.priority(message) != PRIORITY_URGENT
+    assert "call emergency services immediately" not in get_fallback_response(message)
+
+
+@pytest.mark.parametrize("message", ["he is unconscious", "my friend collapsed", "we need an ambulance"])
+def test_emergency_signs_stay_urgent(message):
+    assert matcher.priority(message) == PRIORITY_URGENT
+    assert "call emergency services immediately" in get_fallback_response(message)
+
+
+@pytest.mark.parametrize("message, context, lead", [
+    ("I have fever", {"age": 30}, "fever-adult"),
+    ("I have fever", {"age": 6}, "fever-child"),
+    ("my stomach hurts", None, "abdominal-mild"),
+    ("my back hurts", None, "back-pain"),
+    ("I have a cough with fever and difficulty breathing", None, "resp-pneumonia"),
+])
+def test_best_match_leads_the_answer(message, context, lead):
+    doctor = build_doctor()
+    entries = {entry.id: entry for _, entry in doctor.search(message, k=len(doctor.entries))}
+    assert doctor.answer(message, context).startswith(entries[lead].advice.split("{")[0])
+
+
+def test_urgent_entry_leads_only_when_it_scores_nearly_as_well():
+    doctor = build_doctor()
+    answer = doctor.answer("I have fever", {"age": 30})
+    pneumonia = next(entry for _, entry in doctor.search("I have fever") if entry.id == "resp-pneumonia")
+    # Still offered as related advice, just not ahead of the fever advice
+    assert answer.index(ADULT_FEVER) < answer.index(pneumonia.advice[:40])
@@ -0,0 +1,109 @@
+"""
+Keyset pagination of conversation history, and the write-behind message writer.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from backend import analytics, history
+from backend.models import Base, Conversation, Message, SymptomDailyCount, User
+
+START = datetime(2026, 3, 2, 9, 0)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(id=1, username="zomba", hashed_password="x", location="Zomba"))
+        db.add(User(id=2, username="other", hashed_password="x"))
+        db.add(Conversation(id=1, user_id=1))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+def add(factory, *contents, at=START):
+    with factory() as db:
+        # Equal timestamps on purpose: the id breaks ties at page boundaries
+        db.add_all(Message(conversation_id=1, user_id=1, role="user", content=content, timestamp=at)
+                   for content in contents)
+        db.commit()
+
+
+def page(factory, **options):
+    with factory() as db:
+        result = history.get_message_page(db, 1, 1, **options)
+        return [message.content for message in result["messages"]], result["next_cursor"], result["newer_cursor"]
+
+
+def test_before_walks_back_through_pages(session_factory):
+    add(session_factory, "m1", "m2", "m3", "m4", "m5")
+    newest, cursor, _ = page(session_factory, limit=2)
+    assert newest == ["m4", "m5"]
+    older, cursor, newer = page(session_factory, limit=2, before=cursor)
+    assert older == ["m2", "m3"] and newer is None
+    oldest, cursor, _ = page(session_factory, limit=2, before=cursor)
+    assert oldest == ["m1"] and cursor is None
+
+
+def test_after_walks_forward_to_the_end(session_factory):
+    add(session_factory, "m1", "m2", "m3", "m4")
+    with session_factory() as db:
+        first = db.execute(select(Message).order_by(Message.id)).scalars().first()
+    messages, cursor, _ = page(session_factory, limit=2, after=history.encode_cursor(first))
+    assert messages == ["m2", "m3"]
+    messages, cursor, _ = page(session_factory, limit=2, after=cursor)
+    assert messages == ["m4"] and cursor is None
+
+
+def test_exact_page_boundary_has_no_next_cursor(session_factory):
+    add(session_factory, "m1", "m2", "m3", "m4")
+    messages, cursor, _ = page(session_factory, limit=2)
+    messages, cursor, _ = page(session_factory, limit=2, before=cursor)
+    assert messages == ["m1", "m2"] and cursor is None
+
+
+def test_newest_page_can_be_polled_for_new_messages(session_factory):
+    add(session_factory, "m1", "m2")
+    messages, next_cursor, newer = page(session_factory, limit=5)
+    assert messages == ["m1", "m2"] and next_cursor is None and newer is not None
+
+    assert page(session_factory, limit=5, after=newer) == ([], None, newer)
+    add(session_factory, "m3", at=START + timedelta(minutes=1))
+    messages, _, newest = page(session_factory, limit=5, after=newer)
+    assert messages == ["m3"] and newest != newer
+
+
+def test_invalid_cursor_is_a_400(session_factory):
+    for cursor in ("not-a-cursor", history.encode_cursor(Message(id=1, timestamp=START))[:-4]):
+        with pytest.raises(HTTPException) as invalid:
+            page(session_factory, before=cursor)
+        assert invalid.value.status_code == 400
+
+
+def test_other_users_conversation_is_not_found(session_factory):
+    with session_factory() as db, pytest.raises(HTTPException) as missing:
+        history.get_message_page(db, 1, 2)
+    assert missing.value.status_code == 404
+
+
+def test_stop_flushes_queued_messages(session_factory):
+    writer = history.MessageWriter(session_factory, batch_size=3, flush_interval=0.5)
+    for i in range(10):
+        writer.enqueue(1, 1, "user", f"I have a fever {i}", START, "Zomba")
+    # Nothing written yet; stopping must drain the whole queue, not just one batch
+    writer.start()
+    writer.stop()
+
+    assert writer.stats()["written"] == 10 and writer.stats()["queued"] == 0
+    with session_factory() as db:
+        assert db.execute(select(func.count()).select_from(Message)).scalar() == 10
+        counted = db.execute(select(func.sum(SymptomDailyCount.count))
+                             .where(SymptomDailyCount.category == analytics.classify("I have a fever"))).scalar()
+    assert counted == 10
@@ -0,0 +1,148 @@
+"""
+The pooled inference client, against a stub backend instead of Hugging Face.
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import admission, batching, circuit_breaker, database, inference, main, profile_cache
+from backend.inference import InferenceClient, InferenceError
+from backend.models import User
+
+API_URL = "https://stub.invalid/models/test"
+
+
+class StubBackend:
+    """
+    Answers like a text-generation backend and remembers every request
+    """
+
+    def __init__(self, status_code=200, body=None, stream_lines=None):
+        self.status_code = status_code
+        self.body = body
+        self.stream_lines = stream_lines
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append((request, payload))
+        if self.stream_lines is not None:
+            return httpx.Response(self.status_code, headers={"content-type": "text/event-stream"},
+                                  content="\n".join(self.stream_lines).encode())
+        if self.body is not None:
+            return httpx.Response(self.status_code, json=self.body)
+        prompts = payload["inputs"] if isinstance(payload["inputs"], list) else [payload["inputs"]]
+        return httpx.Response(self.status_code,
+                              json=[{"generated_text": f"{prompt} Answer: rest and drink water"} for prompt in prompts])
+
+
+def stub_client(backend: StubBackend) -> InferenceClient:
+    return InferenceClient(API_URL, api_key="secret", http2=False, transport=httpx.MockTransport(backend))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_generate_posts_the_prompt_and_parses_the_answer():
+    backend = StubBackend()
+
+    async def go():
+        client = stub_client(backend)
+        try:
+            return await client.generate("Question: headache")
+        finally:
+            await client.aclose()
+
+    assert run(go()) == "rest and drink water"
+    request, payload = backend.requests[0]
+    assert str(request.url) == API_URL and request.headers["authorization"] == "Bearer secret"
+    assert payload["inputs"] == "Question: headache" and payload["options"] == {"wait_for_model": True}
+    assert payload["parameters"] == inference.DEFAULT_PARAMETERS
+
+
+def test_backend_errors_raise_inference_error():
+    async def go(backend, prompts):
+        client = stub_client(backend)
+        try:
+            return await client.generate_batch(prompts)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(InferenceError, match="503"):
+        run(go(StubBackend(status_code=503, body={"error": "loading"}), ["a"]))
+    with pytest.raises(InferenceError, match="malformed"):
+        run(go(StubBackend(body=[{"generated_text": "only one"}]), ["a", "b"]))
+
+
+def test_generate_batch_sends_one_request():
+    backend = StubBackend()
+
+    async def go():
+        client = stub_client(backend)
+        try:
+            return await client.generate_batch(["one", "two", "three"])
+        finally:
+            await client.aclose()
+
+    assert run(go()) == ["rest and drink water"] * 3
+    assert len(backend.requests) == 1 and backend.requests[0][1]["inputs"] == ["one", "two", "three"]
+
+
+def test_stream_yields_tokens_and_skips_special_ones():
+    events = [f"data: {json.dumps({'token': {'text': text, 'special': special}})}"
+              for text, special in (("Rest", False), (" well", False), ("</s>", True))]
+    backend = StubBackend(stream_lines=[*events, "", "data: [DONE]"])
+
+    async def go(backend):
+        client = stub_client(backend)
+        try:
+            return [chunk async for chunk in client.stream("Question: tired")]
+        finally:
+            await client.aclose()
+
+    assert run(go(backend)) == ["Rest", " well"]
+    assert backend.requests[0][1]["stream"] is True
+    # A backend without server-sent events answers in one chunk
+    assert run(go(StubBackend())) == ["rest and drink water"]
+
+
+@pytest.fixture
+def app_with_stub_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'inference.db'}")
+    monkeypatch.setenv("AUTO_MIGRATE", "1")
+    monkeypatch.setenv("HF_API_KEY", "secret")
+    monkeypatch.setenv("HF_BATCH_MAX_SIZE", "1")
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "0")
+    for module, name in ((inference, "_client"), (batching, "_batcher"), (profile_cache, "_cache"),
+                         (admission, "_controller"), (admission, "_limiter"), (admission, "_urgent_limiter")):
+        monkeypatch.setattr(module, name, None)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+    backend = StubBackend()
+    created = []
+
+    def from_env():
+        created.append(stub_client(backend))
+        return created[-1]
+
+    monkeypatch.setattr(InferenceClient, "from_env", from_env)
+    return backend, created
+
+
+def test_app_reuses_one_client_and_closes_it_on_shutdown(app_with_stub_backend):
+    backend, created = app_with_stub_backend
+    with TestClient(main.app) as client:
+        with database.SessionLocal() as db:
+            db.add(User(id=1, username="zomba", hashed_password="x", full_name="Chikondi", location="Zomba"))
+            db.commit()
+        for message in ("I have a headache", "I feel tired"):
+            response = client.post("/chat/message", json={"user_id": 1, "message": message, "use_cache": False})
+            assert response.status_code == 200 and response.json()["response"] == "rest and drink water"
+        assert not created[0]._client.is_closed
+
+    assert len(created) == 1 and len(backend.requests) == 2
+    assert created[0]._client.is_closed and inference._client is None
@@ -0,0 +1,94 @@
+"""
+Metrics pooled across worker processes through a shared directory.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from backend.metrics import Counter, Histogram, Registry, SnapshotSharer
+
+
+def worker_registry():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ("route",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0)))
+    return registry, requests, latency
+
+
+def test_scrape_sums_every_workers_snapshot(tmp_path):
+    first, first_requests, first_latency = worker_registry()
+    second, second_requests, second_latency = worker_registry()
+    first_requests.inc("/chat", amount=3)
+    first_latency.observe(0.05, "/chat")
+    second_requests.inc("/chat", amount=2)
+    second_requests.inc("/login")
+    second_latency.observe(0.5, "/chat")
+
+    first_sharer = SnapshotSharer(first, str(tmp_path))
+    second_sharer = SnapshotSharer(second, str(tmp_path))
+    second_sharer.write()
+    text = first.render(first_sharer.collect())
+
+    assert 'requests_total{route="/chat"} 5.0' in text
+    assert 'requests_total{route="/login"} 1.0' in text
+    assert 'latency_seconds_bucket{route="/chat",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/chat",le="1.0"} 2' in text
+    assert 'latency_seconds_count{route="/chat"} 2' in text
+
+
+def test_exited_workers_counts_are_kept(tmp_path):
+    old, old_requests, _ = worker_registry()
+    old_requests.inc("/chat", amount=7)
+    SnapshotSharer(old, str(tmp_path)).stop()  # a recycled worker writes its final snapshot
+
+    new, new_requests, _ = worker_registry()
+    new_requests.inc("/chat")
+    assert 'requests_total{route="/chat"} 8.0' in new.render(SnapshotSharer(new, str(tmp_path)).collect())
+
+
+def test_recycled_workers_fold_into_one_retired_file(tmp_path):
+    for amount in (7, 5):
+        old, old_requests, old_latency = worker_registry()
+        old_requests.inc("/chat", amount=amount)
+        old_latency.observe(0.5, "/chat")
+        sharer = SnapshotSharer(old, str(tmp_path))
+        sharer.start()
+        sharer.stop()
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == [SnapshotSharer.RETIRED]
+
+    new, _, _ = worker_registry()
+    text = new.render(SnapshotSharer(new, str(tmp_path)).collect())
+    assert 'requests_total{route="/chat"} 12.0' in text
+    assert 'latency_seconds_count{route="/chat"} 2' in text
+
+
+def test_snapshot_of_a_worker_that_died_is_compacted(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    (tmp_path / f"{dead.pid}-deadbeef.json").write_text(json.dumps({"requests_total": [[["/chat"], 4.0]]}))
+    live, live_requests, _ = worker_registry()
+    live_requests.inc("/chat")
+    live_sharer = SnapshotSharer(live, str(tmp_path))
+    live_sharer.write()
+
+    registry, _, _ = worker_registry()
+    sharer = SnapshotSharer(registry, str(tmp_path))
+    for _ in range(2):
+        assert 'requests_total{route="/chat"} 5.0' in registry.render(sharer.collect())
+    # The dead worker's counts now live in the retired totals; the live worker keeps its own file
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == \
+        sorted([SnapshotSharer.RETIRED, os.path.basename(live_sharer.path)])
+
+
+def test_unreadable_snapshot_is_skipped(tmp_path):
+    (tmp_path / "broken.json").write_text("{not json")
+    registry, requests, _ = worker_registry()
+    requests.inc("/chat")
+    assert 'requests_total{route="/chat"} 1.0' in registry.render(SnapshotSharer(registry, str(tmp_path)).collect())
+
+
+def test_without_snapshots_renders_this_process():
+    registry, requests, _ = worker_registry()
+    requests.inc("/chat")
+    assert registry.render() == registry.render([registry.snapshot()])
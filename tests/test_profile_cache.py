@@ -0,0 +1,66 @@
+"""
+The per-worker profile cache and invalidations shared between workers.
+"""
+import time
+
+from backend import profile_cache
+from backend.profile_cache import InvalidationLog, ProfileCache, ProfileRecord
+
+
+def record(user_id, location="Zomba"):
+    return ProfileRecord(user_id, "Test User", 30, location)
+
+
+def test_hit_after_put_and_miss_otherwise():
+    cache = ProfileCache()
+    assert cache.get(1) is None
+    cache.put(record(1))
+    assert cache.get(1).location == "Zomba"
+    assert cache.get(2) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_expired_and_evicted_entries_are_misses(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(profile_cache.time, "monotonic", lambda: now[0])
+    cache = ProfileCache(max_entries=2, ttl=10)
+    for user_id in (1, 2, 3):
+        cache.put(record(user_id))
+    assert cache.get(1) is None and cache.stats()["evictions"] == 1
+    now[0] += 11
+    assert cache.get(2) is None and cache.stats()["entries"] == 1
+
+
+def test_invalidation_reaches_another_worker(tmp_path, monkeypatch):
+    path = str(tmp_path / "invalidations.db")
+    editor = ProfileCache(log=InvalidationLog(path))
+    reader = ProfileCache(log=InvalidationLog(path), poll_interval=0.01)
+    reader.put(record(1))
+    reader.put(record(2))
+
+    def polled_on_lookup():
+        raise AssertionError("lookups must not query the invalidation log")
+
+    # Only the polling thread reads the log
+    monkeypatch.setattr(reader.log, "poll", polled_on_lookup)
+    editor.invalidate(1)
+    assert reader.get(1) is not None
+    monkeypatch.undo()
+
+    reader.start()
+    try:
+        deadline = time.monotonic() + 5
+        while reader.get(1) is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        reader.stop()
+    assert reader.get(1) is None
+    assert reader.get(2) is not None
+
+
+def test_polling_only_starts_with_a_log():
+    cache = ProfileCache()
+    cache.start()
+    assert cache._thread is None
+    cache.stop()
@@ -0,0 +1,65 @@
+"""
+ResponseCache with the shared SQLite file: async lookups stay off the event loop.
+"""
+import asyncio
+import sqlite3
+import threading
+
+from backend.response_cache import DiskCache, ResponseCache
+
+
+def test_disk_hit_is_read_in_a_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(disk=DiskCache(path)).set("key", "answer")
+
+    cache = ResponseCache(disk=DiskCache(path))
+    threads = []
+    disk_get = cache.disk.get
+
+    def recording_get(key, now):
+        threads.append(threading.get_ident())
+        return disk_get(key, now)
+
+    monkeypatch.setattr(cache.disk, "get", recording_get)
+
+    async def go():
+        return await cache.get_async("key"), await cache.get_async("key"), threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(go())
+    assert first == second == "answer"
+    # The second lookup is a memory hit; the first went to disk off the loop's thread
+    assert len(threads) == 1 and threads[0] != loop_thread
+    assert cache.stats()["disk_hits"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_set_async_writes_through_to_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    asyncio.run(ResponseCache(disk=DiskCache(path)).set_async("key", "answer"))
+    assert ResponseCache(disk=DiskCache(path)).get("key") == "answer"
+
+
+def test_disk_errors_are_misses(tmp_path, monkeypatch):
+    cache = ResponseCache(disk=DiskCache(str(tmp_path / "cache.db")))
+
+    def broken(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache.disk, "get", broken)
+    monkeypatch.setattr(cache.disk, "set", broken)
+    asyncio.run(cache.set_async("key", "answer"))
+    cache.clear()
+    assert asyncio.run(cache.get_async("key")) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_prune_uses_the_expiry_index(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"), max_entries=3)
+    for i in range(5):
+        disk.set(f"key{i}", "answer", 100.0 + i)
+    disk.prune(101.5)
+    conn = sqlite3.connect(disk.path)
+    assert [row[0] for row in conn.execute("SELECT key FROM response_cache ORDER BY key")] == \
+        ["key2", "key3", "key4"]
+    plan = " ".join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN DELETE FROM response_cache WHERE expires_at <= 1"))
+    assert "response_cache_expires_at" in plan
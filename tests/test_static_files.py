@@ -0,0 +1,79 @@
+"""
+Which frontend directory is served.
+"""
+import asyncio
+import gzip
+import os
+
+import pytest
+
+from backend import static_files
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    source, build = tmp_path / "public", tmp_path / "build" / "public"
+    source.mkdir()
+    (source / "index.html").write_text("<html></html>")
+    monkeypatch.setattr(static_files, "SOURCE_DIR", str(source))
+    monkeypatch.setattr(static_files, "BUILD_DIR", str(build))
+    monkeypatch.delenv("STATIC_DIR", raising=False)
+    monkeypatch.delenv("SERVE_STATIC", raising=False)
+    return source, build
+
+
+def test_serves_the_build_when_it_is_up_to_date(dirs):
+    source, build = dirs
+    static_files.build(str(source), str(build))
+    assert static_files.static_directory() == str(build)
+
+
+def test_serves_public_when_it_was_edited_after_the_build(dirs, capsys):
+    source, build = dirs
+    static_files.build(str(source), str(build))
+    edited = source / "index.html"
+    later = os.path.getmtime(build / static_files.MANIFEST) + 10
+    os.utime(edited, (later, later))
+    assert static_files.static_directory() == str(source)
+    assert "backend.static_files build" in capsys.readouterr().out
+
+
+def test_without_a_build_serves_public(dirs):
+    assert static_files.static_directory() == str(dirs[0])
+
+
+def test_static_dir_and_serve_static_override(dirs, monkeypatch):
+    monkeypatch.setenv("STATIC_DIR", "/srv/frontend")
+    assert static_files.static_directory() == "/srv/frontend"
+    monkeypatch.setenv("SERVE_STATIC", "0")
+    assert static_files.static_directory() is None
+
+
+def test_malformed_quality_skips_only_that_coding():
+    assert static_files._accepted_encodings("br;q=abc, gzip") == {"gzip"}
+    assert static_files._accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+
+
+def get(app, accept_encoding):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/index.html",
+             "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(app(scope, None, send))
+    headers = dict(messages[0]["headers"])
+    return messages[0]["status"], headers.get(b"content-encoding"), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_bad_accept_encoding_is_served_not_an_error(dirs):
+    source, build = dirs
+    (source / "index.html").write_text("<html>" + "hello " * 200 + "</html>")
+    static_files.build(str(source), str(build))
+    # memory_limit=0 streams the file from disk in chunks
+    app = static_files.StaticAssets(str(build), memory_limit=0)
+    status, encoding, body = get(app, "br;q=abc, gzip")
+    assert status == 200 and encoding == b"gzip"
+    assert gzip.decompress(body) == (source / "index.html").read_bytes()
+    assert get(app, "br;q=abc")[:2] == (200, None)
@@ -0,0 +1,37 @@
+"""
+Server-wide limits are split across the worker processes.
+"""
+import pytest
+
+from backend import admission, hashing
+from backend.workers import worker_share
+
+
+@pytest.mark.parametrize("workers, total, share", [
+    ("1", 16, 16), ("4", 16, 4), ("3", 16, 6), ("8", 4, 1), ("4", 0, 0), ("4", 30.0, 7.5), ("4", 0.0, 0.0),
+])
+def test_worker_share(monkeypatch, workers, total, share):
+    monkeypatch.setenv("WEB_CONCURRENCY", workers)
+    assert worker_share(total) == share
+
+
+def test_limits_are_split_across_workers(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("HASH_WORKERS", "8")
+    monkeypatch.delenv("HASH_MAX_PENDING", raising=False)
+    monkeypatch.setenv("ADMISSION_MAX_CONCURRENT", "16")
+    monkeypatch.delenv("ADMISSION_MAX_QUEUE", raising=False)
+    monkeypatch.setenv("RATE_LIMIT_PER_MINUTE", "40")
+    monkeypatch.setenv("RATE_LIMIT_BURST", "10")
+    for name in ("_controller", "_limiter", "_urgent_limiter"):
+        monkeypatch.setattr(admission, name, None)
+    monkeypatch.setattr(hashing, "_pool", None)
+
+    pool = hashing.get_pool()
+    assert (pool.max_workers, pool.max_pending) == (2, 8)
+    controller = admission.get_controller()
+    assert (controller.max_concurrent, controller.max_queue) == (4, 16)
+    limiter = admission.get_rate_limiter()
+    assert (limiter.rate * 60, limiter.burst) == (10, 3)
+    urgent = admission.get_rate_limiter(admission.PRIORITY_URGENT)
+    assert (urgent.rate * 60, urgent.burst) == (30, 8)